@@ -0,0 +1,11 @@
+"""
+Benchmarks of the generation: every simulation, the ocean setup, the
+helpers of worldengine.common and worldengine.simulations.basic, the A*
+path finder and every drawing function, on synthetic worlds of growing
+size.
+
+    python -m benchmarks run -o results.json
+    python -m benchmarks compare results.json --baseline baseline.json
+
+See benchmarks/README.md.
+"""
@@ -0,0 +1,95 @@
+import argparse
+import json
+import logging
+import platform
+import sys
+
+import numpy
+
+from benchmarks import compare, suite
+from worldengine.version import __version__
+
+# import global logger
+import worldengine.logger as logger
+
+
+def _sizes(value):
+    sizes = [int(s) for s in value.split(',')]
+    if any(s < 16 for s in sizes):
+        raise argparse.ArgumentTypeError('Sizes should be at least 16')
+    return sizes
+
+
+def _log(line):
+    sys.stdout.write(line + '\n')
+    sys.stdout.flush()
+
+
+def _run(args):
+    results = suite.run(args.sizes, args.repeat, args.only, args.budget, log=_log)
+    results['version'] = __version__
+    results['python'] = platform.python_version()
+    results['numpy'] = numpy.__version__
+    results['machine'] = platform.platform()
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+    print('Results saved in %s' % args.output)
+    for name in sorted(results['errors']):
+        for size, error in sorted(results['errors'][name].items()):
+            print('\n%s failed at %s:\n%s' % (name, size, error))
+    return 0
+
+
+def _compare(args):
+    with open(args.results) as f:
+        results = json.load(f)['results']
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)['results']
+    lines, flagged = compare.report(results, baseline, args.tolerance,
+                                    args.min_time, args.max_exponent)
+    print('\n'.join(lines))
+    return 1 if flagged else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='python -m benchmarks')
+    commands = parser.add_subparsers(dest='command')
+    commands.required = True
+
+    run = commands.add_parser('run', help='run the benchmarks')
+    run.add_argument('-o', '--output', metavar='FILE', required=True,
+                     help='write the results to FILE, as JSON')
+    run.add_argument('--sizes', metavar='%d,%d...', type=_sizes,
+                     default=list(suite.SIZES),
+                     help='sides of the square worlds [default = 128,512,1024,2048]')
+    run.add_argument('--repeat', metavar='%d', type=int, default=3,
+                     help='runs per benchmark, the best time is kept [default = %(default)s]')
+    run.add_argument('--only', metavar='NAME', action='append',
+                     help='only run the benchmarks whose name contains NAME (repeatable)')
+    run.add_argument('--budget', metavar='SECONDS', type=float, default=600.0,
+                     help='benchmarks slower than this are not run at larger sizes \
+[default = %(default)s]')
+    run.set_defaults(function=_run)
+
+    cmp = commands.add_parser('compare', help='flag regressions and superlinear benchmarks')
+    cmp.add_argument('results', metavar='FILE', help='results of a run')
+    cmp.add_argument('--baseline', metavar='FILE',
+                     help='results of an earlier run to compare with')
+    cmp.add_argument('--tolerance', metavar='%f', type=float, default=0.2,
+                     help='relative slow down tolerated [default = %(default)s]')
+    cmp.add_argument('--min-time', metavar='SECONDS', type=float, default=0.01,
+                     help='differences smaller than this are ignored [default = %(default)s]')
+    cmp.add_argument('--max-exponent', metavar='%f', type=float, default=1.25,
+                     help='benchmarks growing faster than cells ** this are flagged \
+[default = %(default)s]')
+    cmp.set_defaults(function=_compare)
+
+    args = parser.parse_args()
+    logger.init()
+    logger.logger.setLevel(logging.WARNING)  # the drawing functions log every image
+    return args.function(args)
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,111 @@
+"""
+Comparison of benchmark results: regressions against a baseline and the
+way every benchmark scales with the size of the map.
+"""
+
+import math
+
+import numpy
+
+
+def scaling_exponent(times):
+    """
+    :param times: the time of a benchmark by size (the side of the map,
+                  as a string or a number), None for the sizes not run
+    :return: the exponent k of the best fit of time ~ cells ** k, cells
+             being the number of cells of the map; 1 means linear in the
+             area of the map. None if less than two sizes have been timed
+    """
+    points = [(float(size) ** 2, t) for size, t in times.items()
+              if t is not None and t > 0]
+    if len(points) < 2:
+        return None
+    cells, seconds = zip(*points)
+    slope, _ = numpy.polyfit(numpy.log(cells), numpy.log(seconds), 1)
+    return float(slope)
+
+
+def regressions(baseline, results, tolerance=0.2, min_time=0.01):
+    """
+    :param tolerance: relative slow down tolerated before flagging
+    :param min_time: differences below this many seconds are noise
+    :return: the list of (benchmark, size, baseline time, new time) where
+             the new time exceeds the baseline one by more than tolerance
+    """
+    found = []
+    for name in sorted(results):
+        if name not in baseline:
+            continue
+        for size, new in sorted(results[name].items(), key=lambda i: int(i[0])):
+            old = baseline[name].get(size)
+            if old is None or new is None:
+                continue
+            if new > old * (1.0 + tolerance) and new - old > min_time:
+                found.append((name, int(size), old, new))
+    return found
+
+
+def superlinear(results, max_exponent=1.25):
+    """
+    :return: the list of (benchmark, exponent) of the benchmarks growing
+             faster than cells ** max_exponent
+    """
+    found = []
+    for name in sorted(results):
+        exponent = scaling_exponent(results[name])
+        if exponent is not None and exponent > max_exponent:
+            found.append((name, exponent))
+    return found
+
+
+def report(results, baseline=None, tolerance=0.2, min_time=0.01, max_exponent=1.25):
+    """
+    :param results: the 'results' of a benchmark run
+    :param baseline: the 'results' of an earlier run, if any
+    :return: the lines describing the comparison and whether it found
+             regressions or superlinear benchmarks
+    """
+    lines = []
+    sizes = sorted(set(int(size) for times in results.values() for size in times))
+    header = '%-40s' % 'benchmark' + ''.join('%11i' % size for size in sizes) + '   exponent'
+    lines.append(header)
+    lines.append('-' * len(header))
+    for name in sorted(results):
+        times = results[name]
+        row = '%-40s' % name
+        for size in sizes:
+            t = times.get(str(size))
+            row += '%11s' % ('-' if t is None else '%.4f' % t)
+        exponent = scaling_exponent(times)
+        row += '%11s' % ('-' if exponent is None else '%.2f' % exponent)
+        if baseline is not None and name in baseline:
+            old = scaling_exponent(baseline[name])
+            if old is not None and exponent is not None:
+                row += ' (was %.2f)' % old
+        lines.append(row)
+
+    found_regressions = []
+    if baseline is not None:
+        found_regressions = regressions(baseline, results, tolerance, min_time)
+        lines.append('')
+        if found_regressions:
+            lines.append('Regressions (more than %i%% slower than the baseline):'
+                         % int(round(tolerance * 100)))
+            for name, size, old, new in found_regressions:
+                lines.append('  %s at %i: %.4f s -> %.4f s (x%.2f)'
+                             % (name, size, old, new, new / old))
+        else:
+            lines.append('No regression.')
+
+    found_superlinear = superlinear(results, max_exponent)
+    lines.append('')
+    if found_superlinear:
+        lines.append('Superlinear (time growing faster than cells ** %.2f):' % max_exponent)
+        for name, exponent in found_superlinear:
+            # the time taken by a map twice as large (four times the cells)
+            lines.append('  %s: cells ** %.2f, x%.1f when the side doubles'
+                         % (name, exponent, math.pow(4.0, exponent)))
+    else:
+        lines.append('Nothing superlinear.')
+
+    return lines, bool(found_regressions or found_superlinear)
@@ -0,0 +1,200 @@
+"""
+The benchmarks and the synthetic worlds they run on.
+
+A synthetic world is made of simplex noise instead of a plates simulation
+(which is a C extension, measured by itself by --report): the elevation is
+noise whose features are proportional to the size of the map, so worlds of
+all sizes look alike. The stages of generate_world are then benchmarked one
+after the other on that world, each one on the output of the previous ones,
+and the drawing functions on the complete world.
+"""
+
+import copy
+import os
+import shutil
+import tempfile
+import timeit
+import traceback
+
+import numpy
+
+from worldengine import draw
+from worldengine.astar import PathFinder
+from worldengine.common import anti_alias
+from worldengine.generation import STAGES, fill_ocean, \
+    initialize_ocean_and_thresholds, place_oceans_at_map_borders, sea_depth
+from worldengine.model.world import World
+from worldengine.noise_fields import noise_field
+from worldengine.simulations.hydrology import WatermapSimulation
+from worldengine.simulations.basic import find_threshold_f, find_thresholds
+
+SIZES = (128, 512, 1024, 2048)
+
+# used for the synthetic worlds and for the simulations
+SEED = 4242
+
+
+def synthetic_world(size, seed=SEED):
+    """
+    :return: a square world holding elevation, plates, ocean and sea depth,
+             just like the one handed to generate_world by world_gen
+    """
+    world = World('benchmark_%i' % size, size, size, seed, 25.0, 10, 1.0,
+                  [.874, .765, .594, .439, .366, .124],
+                  [.941, .778, .507, .236, 0.073, .014, .002], 1.25, .2)
+    # continents spanning a quarter of the map, with details every few cells
+    elevation = noise_field((size, size), size / 4.0, 8, seed % 4096)
+    world.elevation = ((elevation + 0.2) * 2.0, None)
+    world.plates = numpy.zeros((size, size), dtype=numpy.uint16)
+    place_oceans_at_map_borders(world)
+    initialize_ocean_and_thresholds(world)
+    return world
+
+
+def _ocean_benchmarks(world):
+    elevation = world.layers['elevation'].data
+    return [
+        ('fill_ocean', lambda: fill_ocean(elevation, 1.0)),
+        ('sea_depth', lambda: sea_depth(world, 1.0)),
+        ('anti_alias', lambda: anti_alias(elevation, 10)),
+        ('find_threshold_f', lambda: find_threshold_f(
+            elevation, 0.1, world.layers['ocean'].data)),
+        ('find_thresholds', lambda: find_thresholds(
+            elevation, [.941, .778, .507, .236, .073, .014, .002], world.layers['ocean'].data)),
+    ]
+
+
+def _path_finder_benchmark(world):
+    # across the middle of the map, from a quarter to three quarters of it
+    size = world.size.width
+    source = [size // 4, size // 2]
+    destination = [3 * size // 4, size // 2]
+    elevation = world.layers['elevation'].data
+    return [('PathFinder.find', lambda: PathFinder().find(elevation, source, destination))]
+
+
+def _stage_benchmark(world, simulation, seed):
+    """
+    Executing a simulation changes the world: every repetition starts from
+    the layers as they were before it, restored by the setup (which is not
+    timed), the last one leaves them changed.
+    :return: the name of the benchmark, the function timed and its setup
+    """
+    before = copy.deepcopy(world.layers)
+
+    def _setup():
+        world.layers = copy.deepcopy(before)
+        numpy.random.seed(seed)  # the watermap draws from the global RNG
+
+    def _run():
+        simulation().execute(world, seed)
+    return simulation.__name__ + '.execute', _run, _setup
+
+
+def _watermap_engine_benchmarks(world):
+    # generate_world uses the droplet engine, the others are benchmarked apart
+    return [
+        ('WatermapSimulation.flow', lambda: WatermapSimulation._flow(world, 20000)),
+        ('WatermapSimulation.particles', lambda: WatermapSimulation._particles(world, SEED, 0.25)),
+    ]
+
+
+def _draw_benchmarks(world, directory):
+    def _on_file(function, *args):
+        filename = os.path.join(directory, function.__name__ + '.png')
+        return function.__name__, lambda: function(world, filename, *args)
+
+    return [
+        _on_file(draw.draw_simple_elevation_on_file, world.sea_level()),
+        _on_file(draw.draw_riversmap_on_file),
+        _on_file(draw.draw_grayscale_heightmap_on_file),
+        _on_file(draw.draw_elevation_on_file),
+        ('draw_ocean_on_file', lambda: draw.draw_ocean_on_file(
+            world.layers['ocean'].data, os.path.join(directory, 'draw_ocean_on_file.png'))),
+        _on_file(draw.draw_precipitation_on_file),
+        _on_file(draw.draw_world_on_file),
+        _on_file(draw.draw_temperature_levels_on_file),
+        _on_file(draw.draw_biome_on_file),
+        _on_file(draw.draw_scatter_plot_on_file),
+        _on_file(draw.draw_satellite_on_file),
+        _on_file(draw.draw_icecaps_on_file),
+    ]
+
+
+def _time(function, repeat, setup=None):
+    """
+    :param setup: if given, called before every call of function, untimed
+    :return: the best wall time of repeat calls of function
+    """
+    best = None
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = timeit.default_timer()
+        function()
+        elapsed = timeit.default_timer() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def run(sizes=SIZES, repeat=3, selected=None, budget=600.0, log=None):
+    """
+    Run the benchmarks at every size, from the smallest.
+    :param repeat: number of times each benchmark is run, the best time is kept
+    :param selected: if given, only the benchmarks whose name contains one
+                     of these strings are run (the stages are executed
+                     anyway, later ones need their output)
+    :param budget: a benchmark having taken longer than this many seconds
+                   is not run at the larger sizes
+    :param log: an optional function receiving a line per benchmark
+    :return: a dictionary with the time in seconds of every benchmark by
+             size, and the errors of the ones that failed
+    """
+    results = {}
+    errors = {}
+    over_budget = set()
+    directory = tempfile.mkdtemp(prefix='worldengine_benchmarks')
+
+    def _measure(name, function, size, stage=False, setup=None):
+        wanted = selected is None or any(s in name for s in selected)
+        if not wanted and not stage:
+            return
+        if name in over_budget and not stage:
+            results.setdefault(name, {})[str(size)] = None
+            if log:
+                log('%-40s %5i  skipped, over budget' % (name, size))
+            return
+        try:
+            seconds = _time(function, repeat if wanted else 1, setup)
+        except Exception:
+            errors.setdefault(name, {})[str(size)] = traceback.format_exc()
+            if log:
+                log('%-40s %5i  failed' % (name, size))
+            return
+        if not wanted:
+            return
+        results.setdefault(name, {})[str(size)] = seconds
+        if seconds > budget:
+            over_budget.add(name)
+        if log:
+            log('%-40s %5i  %10.4f s' % (name, size, seconds))
+
+    try:
+        for size in sorted(sizes):
+            world = synthetic_world(size)
+            for name, function in _ocean_benchmarks(world) + _path_finder_benchmark(world):
+                _measure(name, function, size)
+
+            for i, simulation in enumerate(STAGES):
+                name, function, setup = _stage_benchmark(world, simulation, SEED + i)
+                _measure(name, function, size, stage=True, setup=setup)
+
+            for name, function in _watermap_engine_benchmarks(world) + \
+                    _draw_benchmarks(world, directory):
+                _measure(name, function, size)
+    finally:
+        shutil.rmtree(directory)
+
+    return {'sizes': sorted(sizes), 'repeat': repeat, 'results': results,
+            'errors': errors}
+
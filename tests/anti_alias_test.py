@@ -0,0 +1,31 @@
+import unittest
+
+import numpy
+
+from worldengine.common import anti_alias, _anti_alias_iterative
+
+
+class TestAntiAlias(unittest.TestCase):
+
+    def test_antialias(self):
+        original = numpy.array([[0.5, 0.12, 0.7, 0.15, 0.0],
+                                [0.0, 0.12, 0.7, 0.7, 8.0],
+                                [0.2, 0.12, 0.7, 0.7, 4.0]])
+        antialiased = anti_alias(original, 1)
+        self.assertAlmostEqual(1.2781818181818183, antialiased[0][0])
+        self.assertAlmostEqual(0.4918181818181818, antialiased[1][2])
+
+        original = numpy.array([[0.8]])
+        antialiased = anti_alias(original, 10)
+        self.assertAlmostEqual(0.8, antialiased[0][0])
+
+    def test_antialias_matches_iterative(self):
+        rng = numpy.random.RandomState(0)
+        for shape in [(1, 1), (2, 3), (3, 5), (17, 31)]:
+            original = rng.rand(*shape)
+            for steps in [0, 1, 10]:
+                self.assertTrue(numpy.allclose(_anti_alias_iterative(original, steps),
+                                               anti_alias(original, steps)))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,34 @@
+import unittest
+
+import numpy
+
+from worldengine.simulations.basic import find_threshold_f, find_thresholds
+
+
+class TestBasic(unittest.TestCase):
+
+    def test_find_thresholds(self):
+        data = numpy.arange(100, dtype=float).reshape(10, 10)
+        # ten values above 89, 30 above 69, 99 above the float right below 0
+        self.assertEqual([89.0, 69.0, 0.0, 99.0], find_thresholds(data, [0.1, 0.3, 0.99, 0.0]))
+        self.assertEqual(float(numpy.nextafter(0.0, -1.0)), find_thresholds(data, [1.0])[0])
+
+    def test_find_thresholds_with_mask(self):
+        data = numpy.arange(100, dtype=float).reshape(10, 10)
+        mask = data >= 50
+        self.assertEqual([44.0, 24.0], find_thresholds(data, [0.1, 0.5], mask))
+        self.assertEqual([-numpy.inf], find_thresholds(data, [0.5], numpy.ones((10, 10), dtype=bool)))
+
+    def test_find_thresholds_agrees_with_find_threshold_f(self):
+        # values further apart than the resolution of find_threshold_f
+        rng = numpy.random.RandomState(7)
+        data = rng.permutation(numpy.arange(-300, 300) * 0.1).reshape(20, 30)
+        ocean = rng.uniform(size=data.shape) < 0.4
+        fractions = [0.941, 0.778, 0.507, 0.236, 0.073, 0.014, 0.002]
+        expected = [find_threshold_f(data, f, ocean) for f in fractions]
+        for e, t in zip(expected, find_thresholds(data, fractions, ocean)):
+            self.assertEqual(numpy.count_nonzero(data[~ocean] > e),
+                             numpy.count_nonzero(data[~ocean] > t))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,43 @@
+import time
+import unittest
+
+from benchmarks.suite import _time
+from benchmarks.compare import regressions, report, scaling_exponent, superlinear
+
+
+class TestBenchmarks(unittest.TestCase):
+
+    def test_scaling_exponent(self):
+        linear = {'128': 1.0, '256': 4.0, '512': 16.0}
+        self.assertAlmostEqual(1.0, scaling_exponent(linear))
+        quadratic = {'128': 1.0, '256': 16.0, '512': None}
+        self.assertAlmostEqual(2.0, scaling_exponent(quadratic))
+        self.assertIsNone(scaling_exponent({'128': 1.0, '256': None}))
+
+    def test_regressions(self):
+        baseline = {'a': {'128': 1.0, '256': 4.0}, 'b': {'128': 0.001}}
+        results = {'a': {'128': 1.1, '256': 6.0}, 'b': {'128': 0.005}, 'c': {'128': 9.0}}
+        # b is five times slower, but by less than the minimal time
+        self.assertEqual([('a', 256, 4.0, 6.0)], regressions(baseline, results))
+
+    def test_superlinear(self):
+        results = {'linear': {'128': 1.0, '256': 4.0},
+                   'quadratic': {'128': 1.0, '256': 16.0}}
+        self.assertEqual(['quadratic'], [name for name, _ in superlinear(results)])
+        _, flagged = report({'linear': results['linear']}, {'linear': results['linear']})
+        self.assertFalse(flagged)
+        _, flagged = report(results)
+        self.assertTrue(flagged)
+
+    def test_setup_not_timed(self):
+        calls = []
+
+        def setup():
+            calls.append('setup')
+            time.sleep(0.05)
+        seconds = _time(lambda: calls.append('run'), 2, setup)
+        self.assertEqual(['setup', 'run', 'setup', 'run'], calls)
+        self.assertTrue(seconds < 0.05)
+
+if __name__ == '__main__':
+    unittest.main()
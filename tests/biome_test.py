@@ -1,9 +1,12 @@
 import unittest
 import os
 
+import numpy
+
 from worldengine.biome import Biome, Ocean, PolarDesert, SubpolarDryTundra, \
-    CoolTemperateMoistForest, biome_name_to_index, biome_index_to_name
-from worldengine.simulations.biome import BiomeSimulation
+    CoolTemperateMoistForest, Ice, BARE_ROCK, biome_name_to_index, biome_index_to_name, \
+    biome_group_indices
+from worldengine.simulations.biome import BiomeSimulation, _BIOMES_BY_TEMPERATURE
 from worldengine.model.world import World
 
 
@@ -125,6 +128,71 @@ class TestBiome(unittest.TestCase):
         w = World.open_protobuf("%s/seed_28070.world" % self.tests_data_dir)
         cm, biome_cm = BiomeSimulation().execute(w, 28070)
 
+    @staticmethod
+    def _biome_at(w, pos):
+        # the cell by cell classification BiomeSimulation used to do
+        if w.is_ocean(pos):
+            return 'ocean'
+        temperatures = ['polar', 'alpine', 'boreal', 'cool', 'warm', 'subtropical', 'tropical']
+        moistures = ['superarid', 'perarid', 'arid', 'semiarid', 'subhumid', 'humid',
+                     'perhumid']
+        for t, row in zip(temperatures, _BIOMES_BY_TEMPERATURE):
+            if getattr(w, 'is_temperature_' + t)(pos):
+                for m, name in zip(moistures, row[:-1]):
+                    if getattr(w, 'is_moisture_' + m)(pos):
+                        return name
+                return row[-1]
+        return 'bare rock'
+
+    def _check_biomes(self, temperature_thresholds, moisture_quantiles):
+        rng = numpy.random.RandomState(3)
+        w = World('biomes', 40, 30, 3, 25.0, 10, 1.0,
+                  [.874, .765, .594, .439, .366, .124],
+                  [.941, .778, .507, .236, 0.073, .014, .002], 1.25, .2)
+        temperature = rng.uniform(0.0, 1.0, (30, 40))
+        moisture = rng.uniform(0.0, 1.0, (30, 40))
+        temperature[0, :5] = numpy.nan
+        moisture[1, :5] = numpy.nan
+        w.ocean = rng.uniform(size=(30, 40)) < 0.2
+        names = ['polar', 'alpine', 'boreal', 'cool', 'warm', 'subtropical']
+        w.temperature = (temperature, list(zip(names, temperature_thresholds)) +
+                         [('tropical', None)])
+        w.moisture = (moisture, dict(zip(['87', '75', '62', '50', '37', '25', '12'],
+                                         moisture_quantiles)))
+        cm, biome_cm = BiomeSimulation().execute(w, 3)
+
+        biome = w.layers['biome'].data
+        counts = {}
+        for y in range(30):
+            for x in range(40):
+                name = self._biome_at(w, (x, y))
+                if name == 'bare rock':
+                    self.assertEqual(BARE_ROCK, biome[y, x], (x, y))
+                else:
+                    self.assertEqual(name, biome_index_to_name(biome[y, x]), (x, y))
+                counts[name] = counts.get(name, 0) + 1
+        self.assertEqual(counts, biome_cm)
+
+    def test_biomes_cell_by_cell(self):
+        self._check_biomes([.1, .2, .35, .5, .6, .8], [.1, .2, .3, .5, .6, .7, .9])
+
+    def test_biomes_with_thresholds_out_of_order(self):
+        self._check_biomes([.1, .3, .2, .5, .5, .8], [.1, .2, .6, .5, .3, .7, .9])
+
+    def test_biome_layer(self):
+        w = World('biomes', 3, 2, 3, 25.0, 10, 1.0,
+                  [.874, .765, .594, .439, .366, .124],
+                  [.941, .778, .507, .236, 0.073, .014, .002], 1.25, .2)
+        w.biome = numpy.array([['ocean', 'ice', 'polar desert'],
+                               ['tropical rain forest', 'cool temperate steppe', 'ice']], dtype=object)
+        self.assertEqual(numpy.uint8, w.biome.dtype)
+        self.assertEqual(biome_name_to_index('tropical rain forest'), w.biome[1, 0])
+        self.assertTrue(isinstance(w.biome_at((1, 0)), Ice))
+        self.assertTrue(w.is_iceland((2, 0)))
+        self.assertFalse(w.is_iceland((0, 1)))
+        self.assertEqual({biome_name_to_index('ice'), biome_name_to_index('polar desert')},
+                         set(biome_group_indices()['iceland']))
+
     @staticmethod
     def name():
         return 'cool temperate moist forest'
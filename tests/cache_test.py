@@ -0,0 +1,63 @@
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+import numpy
+
+from worldengine.cache import StageCache
+
+
+class TestCache(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_key(self):
+        a = numpy.arange(6.0).reshape(2, 3)
+        self.assertEqual(StageCache.key(1, 'x', a), StageCache.key(1, 'x', a.copy()))
+        self.assertNotEqual(StageCache.key(1, 'x', a), StageCache.key(2, 'x', a))
+        self.assertNotEqual(StageCache.key(1, 'x', a), StageCache.key(1, 'x', a.reshape(3, 2)))
+        self.assertNotEqual(StageCache.key([1, 2]), StageCache.key((1, 2)))
+
+    def test_store_and_load(self):
+        cache = StageCache(self.directory)
+        self.assertTrue(cache.load('missing') is None)
+        cache.store('k', (None, {'ocean': numpy.ones((2, 2), dtype=bool)}, None))
+        result, layers, rng_state = cache.load('k')
+        self.assertTrue(result is None and rng_state is None)
+        self.assertTrue(layers['ocean'].all())
+
+    def test_store_without_os_replace(self):
+        # Python < 3.3: the entry is renamed over the previous one
+        cache = StageCache(self.directory)
+        replace = os.replace
+        del os.replace
+        try:
+            cache.store('k', 1)
+            cache.store('k', 2)
+        finally:
+            os.replace = replace
+        self.assertEqual(2, cache.load('k'))
+        self.assertEqual(['k.stage'], os.listdir(self.directory))
+
+    def test_least_recently_used_are_evicted(self):
+        cache = StageCache(self.directory)
+        now = time.time()
+        for age, key in [(300, 'a'), (200, 'b'), (100, 'c')]:
+            cache.store(key, numpy.zeros(100))
+            os.utime(os.path.join(self.directory, key + '.stage'), (now - age, now - age))
+        cache.max_size = os.path.getsize(os.path.join(self.directory, 'a.stage')) * 3
+
+        cache.load('a')  # 'b' is now the least recently used one
+        cache.store('d', numpy.zeros(100))
+        self.assertTrue(cache.load('b') is None)
+        for key in ['a', 'c', 'd']:
+            self.assertTrue(cache.load(key) is not None)
+
+if __name__ == '__main__':
+    unittest.main()
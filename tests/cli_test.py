@@ -39,6 +39,16 @@ class TestCLI(TestBase):
         sys.argv = ["python", "plates", "--number-of-plates", "101"]
         self.assertRaises(SystemExit, main)
 
+    def test_batch_options(self):
+        backup_argv = sys.argv
+        sys.argv = ["python", "batch"]
+        self.assertRaises(SystemExit, main)
+        sys.argv = ["python", "batch", "--seeds", "5-3"]
+        self.assertRaises(SystemExit, main)
+        sys.argv = ["python", "batch", "--seeds", "1-70000"]
+        self.assertRaises(SystemExit, main)
+        sys.argv = backup_argv
+
     def test_warnings(self):
         backup_argv = sys.argv
         sys.argv = ["python", "--width", "16", "--height", "16",
@@ -0,0 +1,192 @@
+import math
+import unittest
+
+import numpy
+
+from worldengine.model.world import World
+from worldengine.simulations.erosion import DIR_NEIGHBORS_CENTER, RIVER_TH, \
+    ErosionSimulation, Rivers, in_circle
+
+
+class TestErosionSimulation(unittest.TestCase):
+
+    def setUp(self):
+        rng = numpy.random.RandomState(11)
+        self.w = World("erosion", 23, 17, 11, 25.0, 10, 1.0,
+                       [.874, .765, .594, .439, .366, .124],
+                       [.941, .778, .507, .236, 0.073, .014, .002], 1.25, .2)
+        # a few plateaus, for the ties
+        elevation = numpy.round(rng.uniform(0.0, 4.0, size=(17, 23)), 1)
+        self.w.elevation = (elevation, None)
+
+    def _cell_by_cell(self, erosion):
+        water_path = numpy.zeros((17, 23), dtype=int)
+        for y in range(17):
+            for x in range(23):
+                path = erosion.find_quick_path([x, y], self.w)
+                if path:
+                    flow_dir = [path[0] - x, path[1] - y]
+                    if flow_dir in DIR_NEIGHBORS_CENTER:  # not across the border
+                        water_path[y, x] = DIR_NEIGHBORS_CENTER.index(flow_dir)
+        return water_path
+
+    def test_find_water_flow(self):
+        for wrap in (True, False):
+            erosion = ErosionSimulation()
+            erosion.wrap = wrap
+            water_path = numpy.zeros((17, 23), dtype=int)
+            erosion.find_water_flow(self.w, water_path)
+            numpy.testing.assert_array_equal(self._cell_by_cell(erosion), water_path)
+            # the last row and column have a direction too
+            self.assertTrue(water_path[-1].any())
+            self.assertTrue(water_path[:, -1].any())
+
+    def test_river_sources(self):
+        rng = numpy.random.RandomState(3)
+        # a noisy cone, on a 23 x 17 world
+        ys, xs = numpy.indices((17, 23))
+        elevation = 3.0 - numpy.hypot(xs - 11, ys - 8) / 4.0 + rng.uniform(0, 0.3, size=(17, 23))
+        self.w.elevation = (elevation, [('sea', 0.5), ('plain', 1.0), ('hill', 1.5),
+                                        ('mountain', None)])
+        self.w.ocean = elevation < 0.5
+        self.w.precipitation = (rng.uniform(0.0, 0.01, size=(17, 23)), [])
+        water_path = numpy.zeros((17, 23), dtype=int)
+        ErosionSimulation().find_water_flow(self.w, water_path)
+        water_flow = numpy.zeros((17, 23))
+        sources = ErosionSimulation.river_sources(self.w, water_flow, water_path)
+
+        # every cell adding its rainfall to the cells down its path
+        rain = self.w.layers['precipitation'].data
+        expected = rain.copy()
+        for y in range(17):
+            for x in range(23):
+                cx, cy = x, y
+                while water_path[cy, cx] != 0:
+                    dx, dy = DIR_NEIGHBORS_CENTER[water_path[cy, cx]]
+                    cx, cy = cx + dx, cy + dy
+                    expected[cy, cx] += rain[y, x]
+        numpy.testing.assert_allclose(expected, water_flow, rtol=1e-12)
+
+        # following the paths until they stop
+        expected = []
+        for y in range(17):
+            for x in range(23):
+                if water_path[y, x] == 0:
+                    continue
+                cx, cy = x, y
+                while True:
+                    if self.w.is_mountain((cx, cy)) and water_flow[cy, cx] >= RIVER_TH:
+                        if not any(in_circle(9, cx, cy, sx, sy) for sx, sy in expected):
+                            expected.append([cx, cy])
+                        break
+                    if water_path[cy, cx] == 0:
+                        break
+                    dx, dy = DIR_NEIGHBORS_CENTER[water_path[cy, cx]]
+                    cx, cy = cx + dx, cy + dy
+        self.assertTrue(len(expected) > 1)
+        self.assertEqual(expected, sources)
+
+    def test_rivers(self):
+        rivers = Rivers(23, 17)
+        rivers.append([[1, 1], [2, 1], [3, 1], [2, 1], [2, 2]])
+        rivers.append([[5, 5], [4, 5], [3, 5], [2, 5], [2, 4], [2, 3], [2, 2], [2, 3]])
+        # the first river going through a cell, from its first position in it
+        self.assertEqual([[2, 1], [3, 1], [2, 1], [2, 2]], rivers.tail(2, 1))
+        self.assertEqual([[2, 2]], rivers.tail(2, 2))
+        self.assertEqual([[2, 3], [2, 2], [2, 3]], rivers.tail(2, 3))
+        self.assertIsNone(rivers.tail(0, 0))
+        self.assertEqual(2, len(rivers))
+        numpy.testing.assert_array_equal([5, 4, 3, 2, 2, 2, 2, 2], rivers.cells[1][0])
+
+    def test_river_updates(self):
+        river = [[3, 3], [4, 3], [4, 4], [3, 4], [3, 3], [3, 2], [2, 2]]
+        rivers = Rivers(23, 17)
+        rivers.append(river)
+        elevation = self.w.layers['elevation'].data
+
+        # each point lowered to the lowest before it, one cell at a time
+        expected = elevation.copy()
+        lowest = 1.0
+        for x, y in river:
+            if expected[y, x] <= lowest:
+                lowest = expected[y, x]
+            else:
+                expected[y, x] = lowest
+        ErosionSimulation().cleanUpFlow(rivers.cells[0], self.w)
+        numpy.testing.assert_array_equal(expected, elevation)
+
+        rain = numpy.random.RandomState(2).uniform(size=(17, 23))
+        water_flow = numpy.random.RandomState(4).uniform(size=(17, 23))
+        expected = numpy.zeros((17, 23))
+        for i, (x, y) in enumerate(river):
+            px, py = river[i - 1]
+            expected[y, x] = water_flow[y, x] if i == 0 else rain[y, x] + expected[py, px]
+        rivermap = numpy.zeros((17, 23))
+        ErosionSimulation().rivermap_update(rivers.cells[0], water_flow, rivermap, rain)
+        numpy.testing.assert_array_equal(expected, rivermap)
+
+    def _lower_elevation(self, source, wrap):
+        # the search as it was written, ring after ring of a growing circle
+        elevation = self.w.layers['elevation'].data
+        x, y = source
+        lowest = elevation[y, x]
+        destination, wrapped = [], []
+        radius = 1
+        while not destination and radius <= 40:
+            for cx in range(-radius, radius + 1):
+                for cy in range(-radius, radius + 1):
+                    rx, ry = x + cx, y + cy
+                    if not wrap and not self.w.contains((rx, ry)):
+                        continue
+                    if not in_circle(radius, x, y, rx, ry):
+                        continue
+                    rx, ry = rx % 23, ry % 17
+                    if elevation[ry, rx] < lowest:
+                        lowest = elevation[ry, rx]
+                        destination = [rx, ry]
+                        if not self.w.contains((x + cx, y + cy)):
+                            wrapped.append(destination)
+            radius += 1
+        return destination in wrapped, destination
+
+    def test_find_lower_elevation(self):
+        for wrap in (True, False):
+            erosion = ErosionSimulation()
+            erosion.wrap = wrap
+            for y in range(17):
+                for x in range(23):
+                    self.assertEqual(self._lower_elevation([x, y], wrap),
+                                     erosion.findLowerElevation([x, y], self.w))
+
+    def test_river_erosion(self):
+        # a river winding back next to itself, along the border of the map
+        river = [[0, 5], [1, 5], [2, 5], [3, 5], [3, 4], [3, 3], [2, 3], [1, 3],
+                 [1, 2], [2, 2], [3, 2], [4, 2], [5, 2], [5, 1], [5, 0]]
+        rivers = Rivers(23, 17)
+        rivers.append(river)
+        elevation = self.w.layers['elevation'].data
+        before, expected = elevation.copy(), elevation.copy()
+        for rx, ry in river:
+            for x in range(rx - 2, rx + 2):
+                for y in range(ry - 2, ry + 2):
+                    if not self.w.contains((x, y)) or [x, y] in river or [x, y] == [0, 0]:
+                        continue
+                    if expected[y, x] <= expected[ry, rx] or not in_circle(2, rx, ry, x, y):
+                        continue
+                    adx, ady = math.fabs(rx - x), math.fabs(ry - y)
+                    curve = 0.2 if adx == 1 or ady == 1 else 0.05
+                    expected[y, x] += (expected[ry, rx] - expected[y, x]) * curve
+        ErosionSimulation().river_erosion(rivers.cells[0], self.w)
+        self.assertTrue((expected != before).any())
+        numpy.testing.assert_array_equal(expected, elevation)
+
+    def test_river_erosion_skips_origin(self):
+        # the cell at 0, 0 of the map is never eroded, as it never was
+        rivers = Rivers(23, 17)
+        rivers.append([[1, 1], [1, 0], [2, 0]])
+        elevation = self.w.layers['elevation'].data
+        elevation[:] = 3.0
+        elevation[[1, 0, 0], [1, 1, 2]] = 0.0
+        ErosionSimulation().river_erosion(rivers.cells[0], self.w)
+        self.assertEqual(3.0, elevation[0, 0])
+        self.assertTrue(elevation[1, 0] < 3.0)
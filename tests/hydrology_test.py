@@ -0,0 +1,148 @@
+import logging
+import unittest
+
+import numpy
+
+from worldengine.model.world import World
+from worldengine.simulations.hydrology import WatermapSimulation, _NEIGHBOURS
+from worldengine.simulations.plates import world_gen
+
+# import global logger
+import worldengine.logger as logger
+
+
+class _Messages(logging.Handler):
+
+    def __init__(self):
+        logging.Handler.__init__(self, logging.DEBUG)
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(record.getMessage())
+
+
+class TestWatermapSimulation(unittest.TestCase):
+
+    def setUp(self):
+        rng = numpy.random.RandomState(3)
+        self.w = World("watermap", 24, 16, 3, 25.0, 10, 1.0,
+                       [.874, .765, .594, .439, .366, .124],
+                       [.941, .778, .507, .236, 0.073, .014, .002], 1.25, .2)
+        y, x = numpy.mgrid[0:16, 0:24]
+        elevation = 10.0 - numpy.hypot(y - 8, x - 12) * 0.7 + rng.uniform(size=(16, 24)) * 2
+        self.w.elevation = (elevation, None)
+        self.w.ocean = elevation < 3.0
+        self.w.precipitation = (rng.uniform(-0.2, 1.0, size=(16, 24)), None)
+
+    def _tile_by_tile(self, n):
+        # the water of every land tile handed down, from the highest tile
+        elevation = self.w.layers['elevation'].data
+        ocean = self.w.layers['ocean'].data
+        precipitation = self.w.layers['precipitation'].data
+        shares = WatermapSimulation._shares(elevation)
+        held = numpy.where(numpy.logical_or(ocean, precipitation <= 0), 0.0, precipitation)
+        held *= float(n) / numpy.count_nonzero(numpy.logical_not(ocean))
+        watermap = numpy.zeros(elevation.shape)
+        for i in numpy.argsort(-elevation, axis=None, kind='mergesort'):
+            y, x = numpy.unravel_index(i, elevation.shape)
+            if ocean[y, x]:
+                continue
+            total = shares[:, y, x].sum()
+            if total == 0:
+                watermap[y, x] += held[y, x]
+            for k, (dx, dy) in enumerate(_NEIGHBOURS):
+                if shares[k, y, x] > 0 and not ocean[y + dy, x + dx]:
+                    q = held[y, x] * (shares[k, y, x] / float(total))
+                    held[y + dy, x + dx] += q
+                    watermap[y + dy, x + dx] += q
+        return watermap
+
+    def test_flow_matches_tile_by_tile(self):
+        WatermapSimulation(engine='flow', n=500).execute(self.w, 3)
+        watermap = self.w.layers['watermap']
+        numpy.testing.assert_allclose(self._tile_by_tile(500), watermap.data, rtol=1e-12)
+        self.assertFalse(watermap.data[self.w.layers['ocean'].data].any())
+        self.assertTrue(watermap.thresholds['creek'] <= watermap.thresholds['river'] <=
+                        watermap.thresholds['main river'])
+
+    def test_shares(self):
+        elevation = numpy.array([[5.0, 5.0, 5.0],
+                                 [5.0, 4.0, 2.9],
+                                 [3.8, 5.0, 1.0]])
+        shares = WatermapSimulation._shares(elevation)
+        by_neighbour = dict(zip(_NEIGHBOURS, shares[:, 1, 1]))
+        # 4 per unit of difference, at least 1 for the lowest so far
+        self.assertEqual(1, by_neighbour[(-1, 1)])
+        self.assertEqual(4, by_neighbour[(1, 0)])
+        self.assertEqual(12, by_neighbour[(1, 1)])
+        self.assertEqual(0, by_neighbour[(0, -1)])
+
+    def test_global_rng(self):
+        # one draw per droplet with the droplet engine, the default one, none
+        # with the flow engine
+        land = numpy.count_nonzero(numpy.logical_not(self.w.layers['ocean'].data))
+        numpy.random.seed(3)
+        for _ in range(200):
+            numpy.random.randint(0, land)
+        expected = numpy.random.randint(0, 1000)
+
+        numpy.random.seed(3)
+        WatermapSimulation(n=200).execute(self.w, 3)
+        self.assertTrue(self.w.layers['watermap'].data.any())
+        self.assertEqual(expected, numpy.random.randint(0, 1000))
+
+        del self.w.layers['watermap']
+        numpy.random.seed(3)
+        WatermapSimulation(engine='flow').execute(self.w, 3)
+        self.assertEqual(numpy.random.RandomState(3).randint(0, 1000), numpy.random.randint(0, 1000))
+        self.assertRaises(ValueError, WatermapSimulation, engine='rain')
+
+    def test_particles(self):
+        stats = WatermapSimulation(engine='particles', density=2.0).execute(self.w, 3)
+        watermap = self.w.layers['watermap'].data
+        land = numpy.count_nonzero(numpy.logical_not(self.w.layers['ocean'].data))
+        self.assertEqual(2 * land, stats['droplets'])
+        self.assertTrue(stats['particle_steps'] >= stats['rounds'] > 0)
+        self.assertTrue(watermap.any())
+        self.assertFalse(watermap[self.w.layers['ocean'].data].any())
+
+        del self.w.layers['watermap']
+        WatermapSimulation(engine='particles', density=2.0).execute(self.w, 3)
+        numpy.testing.assert_array_equal(watermap, self.w.layers['watermap'].data)
+
+    def _world_gen(self, stage_options=None):
+        """:return: a small world and the messages logged"""
+        handler = _Messages()
+        previous = getattr(logger, 'logger', None)
+        logger.logger = logging.getLogger(__name__)
+        logger.logger.setLevel(logging.DEBUG)
+        logger.logger.addHandler(handler)
+        try:
+            numpy.random.seed(3)
+            w = world_gen("watermap", 32, 32, 0.0, 3, stage_options=stage_options)
+        finally:
+            logger.logger.removeHandler(handler)
+            if previous is not None:
+                logger.logger = previous
+        return w, handler.messages
+
+    def test_engine_of_world_gen(self):
+        w, messages = self._world_gen()
+        droplet = w.layers['watermap'].data
+        self.assertFalse([m for m in messages if 'particle steps' in m])
+
+        w, messages = self._world_gen({'WatermapSimulation': {'engine': 'particles'}})
+        particles = w.layers['watermap'].data
+        self.assertEqual(1, len([m for m in messages if 'particle steps' in m]))
+        self.assertFalse(numpy.array_equal(droplet, particles))
+
+        w, messages = self._world_gen({'WatermapSimulation': {'engine': 'flow'}})
+        flow = w.layers['watermap'].data
+        self.assertFalse([m for m in messages if 'particle steps' in m])
+        self.assertFalse(numpy.array_equal(droplet, flow))
+        del w.layers['watermap']
+        WatermapSimulation(engine='flow').execute(w, 0)  # the flow engine ignores the seed
+        numpy.testing.assert_array_equal(flow, w.layers['watermap'].data)
+
+if __name__ == '__main__':
+    unittest.main()
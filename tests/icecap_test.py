@@ -0,0 +1,88 @@
+import logging
+import unittest
+
+import numpy
+
+from worldengine.model.world import World
+from worldengine.simulations.icecap import IcecapSimulation
+from worldengine.simulations.plates import world_gen
+
+# import global logger
+import worldengine.logger as logger
+
+
+class TestIcecapSimulation(unittest.TestCase):
+
+    def setUp(self):
+        rng = numpy.random.RandomState(7)
+        self.w = World("icecap", 40, 30, 7, 25.0, 10, 1.0,
+                       [.874, .765, .594, .439, .366, .124],
+                       [.941, .778, .507, .236, 0.073, .014, .002], 1.25, .2)
+        self.w.ocean = rng.uniform(size=(30, 40)) < 0.8
+        temperature = rng.uniform(size=(30, 40))
+        self.w.temperature = (temperature, [('polar', 0.9), ('tropical', None)])
+
+    def _cell_by_cell(self, seed):
+        # the original implementation, drawing a random number per tile which may freeze
+        ocean = self.w.layers['ocean'].data
+        temperature = self.w.layers['temperature'].data
+        height, width = temperature.shape
+        temp_min = temperature.min()
+        freeze_threshold = (0.9 - temp_min) * 0.6
+        freeze_chance_threshold = freeze_threshold * 0.8
+        icecap = numpy.zeros((height, width))
+        rng = numpy.random.RandomState(seed)
+        solid_map = numpy.logical_or(temperature <= freeze_chance_threshold + temp_min,
+                                     numpy.logical_not(ocean))
+        for y in range(height):
+            for x in range(width):
+                t = temperature[y, x]
+                if ocean[y, x] and t - temp_min < freeze_threshold:
+                    chance = numpy.interp(t, [temp_min, freeze_chance_threshold, freeze_threshold],
+                                          [1.0, 1.0, 0.0])
+                    if 0 < x < width - 1 and 0 < y < height - 1:
+                        surr_tiles = solid_map[y-1:y+2, x-1:x+2]
+                        chance_mod = numpy.count_nonzero(surr_tiles)
+                        chance_mod -= 1 if solid_map[y, x] else 0
+                        chance += numpy.interp(chance_mod, [0, 8], [-1.0, 1.0]) * 0.5
+                    if rng.rand() <= chance:
+                        solid_map[y, x] = True
+                        icecap[y, x] = freeze_threshold - (t - temp_min)
+        return icecap
+
+    def test_legacy_mode_matches_cell_by_cell(self):
+        for seed in (1, 2, 3):
+            IcecapSimulation().execute(self.w, seed)
+            numpy.testing.assert_array_equal(self._cell_by_cell(seed),
+                                             self.w.layers['icecap'].data)
+
+    def test_fast_mode(self):
+        IcecapSimulation(mode='fast').execute(self.w, 1)
+        fast = self.w.layers['icecap'].data
+        IcecapSimulation(mode='fast').execute(self.w, 1)
+        numpy.testing.assert_array_equal(fast, self.w.layers['icecap'].data)
+
+        # ice only where it can be, as thick as in legacy mode
+        temperature = self.w.layers['temperature'].data
+        temp_min = temperature.min()
+        thickness = (0.9 - temp_min) * 0.6 - (temperature - temp_min)
+        frozen = fast > 0
+        self.assertTrue(frozen.any())
+        self.assertTrue(self.w.layers['ocean'].data[frozen].all())
+        numpy.testing.assert_array_equal(thickness[frozen], fast[frozen])
+        self.assertRaises(ValueError, IcecapSimulation, mode='quick')
+
+
+    def test_mode_of_world_gen(self):
+        if not hasattr(logger, 'logger'):  # the stages log as they finish
+            logger.logger = logging.getLogger(__name__)
+        numpy.random.seed(5)
+        w = world_gen("icecap", 48, 32, 0.0, 5,
+                      stage_options={'IcecapSimulation': {'mode': 'fast'}})
+        seed = numpy.random.RandomState(5).randint(0, numpy.iinfo(numpy.int32).max, size=100)[8]
+        expected = IcecapSimulation._calculate(w, seed, 'fast')
+        numpy.testing.assert_array_equal(expected, w.layers['icecap'].data)
+        self.assertFalse(numpy.array_equal(IcecapSimulation._calculate(w, seed, 'legacy'), expected))
+
+if __name__ == '__main__':
+    unittest.main()
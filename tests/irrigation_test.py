@@ -0,0 +1,49 @@
+import unittest
+
+import numpy
+
+from worldengine.model.world import World
+from worldengine.simulations.irrigation import IrrigationSimulation, _kernel
+
+
+class TestIrrigationSimulation(unittest.TestCase):
+
+    def setUp(self):
+        rng = numpy.random.RandomState(5)
+        self.w = World("irrigation", 30, 12, 5, 25.0, 10, 1.0,
+                       [.874, .765, .594, .439, .366, .124],
+                       [.941, .778, .507, .236, 0.073, .014, .002], 1.25, .2)
+        self.w.ocean = rng.uniform(size=(12, 30)) < 0.5
+        self.w.watermap = (rng.uniform(size=(12, 30)), {'creek': 0.5, 'river': 0.7, 'main river': 0.9})
+
+    def _tile_by_tile(self, radius):
+        # every ocean tile spreading its water around, clipped at the borders
+        ocean = self.w.layers['ocean'].data
+        watermap = self.w.layers['watermap'].data
+        values = numpy.zeros(ocean.shape)
+        for y, x in zip(*numpy.nonzero(ocean)):
+            for ty in range(max(y - radius, 0), min(y + radius + 1, ocean.shape[0])):
+                for tx in range(max(x - radius, 0), min(x + radius + 1, ocean.shape[1])):
+                    d = numpy.sqrt((tx - x) ** 2 + (ty - y) ** 2)
+                    values[ty, tx] += watermap[y, x] / (numpy.log1p(d) + 1)
+        return values
+
+    def test_matches_tile_by_tile(self):
+        for radius in (10, 3):
+            IrrigationSimulation(radius=radius).execute(self.w, 1)
+            numpy.testing.assert_allclose(self._tile_by_tile(radius),
+                                          self.w.layers['irrigation'].data, rtol=1e-12)
+            del self.w.layers['irrigation']
+
+    def test_kernel_cached_by_radius(self):
+        self.assertIs(_kernel(4), _kernel(4))
+        self.assertEqual((9, 9), _kernel(4).shape)
+        self.assertEqual(1.0, _kernel(4)[4, 4])
+
+    def test_no_water_on_the_ocean(self):
+        self.w.watermap = (numpy.where(self.w.layers['ocean'].data, 0.0, 1.0), {})
+        IrrigationSimulation().execute(self.w, 1)
+        self.assertFalse(self.w.layers['irrigation'].data.any())
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,64 @@
+import logging
+import unittest
+
+import numpy
+
+from worldengine.model.world import World
+from worldengine.simulations.basic import find_threshold_f
+from worldengine.simulations.moisture import MoistureSimulation
+from worldengine.simulations.plates import world_gen
+
+# import global logger
+import worldengine.logger as logger
+
+
+class TestMoistureSimulation(unittest.TestCase):
+
+    def setUp(self):
+        rng = numpy.random.RandomState(7)
+        self.w = World("moisture", 40, 25, 7, 25.0, 10, 1.0,
+                       [.874, .765, .594, .439, .366, .124],
+                       [.941, .778, .507, .236, 0.073, .014, .002], 1.25, .2)
+        self.w.ocean = rng.uniform(size=(25, 40)) < 0.3
+        self.w.precipitation = (rng.uniform(-1.0, 1.0, size=(25, 40)), [])
+        self.w.irrigation = rng.uniform(size=(25, 40))
+
+    def test_moisture(self):
+        MoistureSimulation().execute(self.w, 1)
+        moisture = self.w.layers['moisture']
+        expected = (self.w.layers['precipitation'].data * 1.0 -
+                    self.w.layers['irrigation'].data * 3) / (1.0 + 3)
+        self.assertEqual(numpy.float64, moisture.data.dtype)
+        numpy.testing.assert_array_equal(expected, moisture.data)
+
+        ocean = self.w.layers['ocean'].data
+        for name, fraction in zip(['12', '25', '37', '50', '62', '75', '87'],
+                                  reversed(self.w.moisture_ranges)):
+            self.assertAlmostEqual(find_threshold_f(expected, fraction, ocean),
+                                   moisture.quantiles[name], delta=0.01)
+
+    def test_float32(self):
+        MoistureSimulation().execute(self.w, 1)
+        expected = self.w.layers['moisture']
+        del self.w.layers['moisture']
+        MoistureSimulation(dtype=numpy.float32).execute(self.w, 1)
+        moisture = self.w.layers['moisture']
+        self.assertEqual(numpy.float32, moisture.data.dtype)
+        numpy.testing.assert_allclose(expected.data, moisture.data, rtol=1e-6, atol=1e-7)
+
+        # the quantiles split the stored values exactly like the float64 ones do
+        land = numpy.logical_not(self.w.layers['ocean'].data)
+        for name, threshold in expected.quantiles.items():
+            self.assertEqual(numpy.count_nonzero(expected.data[land] > threshold),
+                             numpy.count_nonzero(moisture.data[land] > moisture.quantiles[name]))
+
+    def test_unknown_dtype(self):
+        self.assertRaises(ValueError, MoistureSimulation, dtype=numpy.int32)
+
+    def test_dtype_of_world_gen(self):
+        if not hasattr(logger, 'logger'):  # the stages log as they finish
+            logger.logger = logging.getLogger(__name__)
+        numpy.random.seed(5)
+        w = world_gen("moisture", 32, 32, 0.0, 5,
+                      stage_options={'MoistureSimulation': {'dtype': 'float32'}})
+        self.assertEqual(numpy.float32, w.layers['moisture'].data.dtype)
@@ -0,0 +1,48 @@
+import unittest
+import numpy
+from noise import snoise2
+from worldengine.noise_fields import snoise2_array, noise_field, wrapped_noise_field
+
+
+class TestNoiseFields(unittest.TestCase):
+
+    def test_snoise2_array_matches_snoise2(self):
+        rng = numpy.random.RandomState(0)
+        xs = rng.uniform(-300.0, 300.0, 500)
+        ys = rng.uniform(-300.0, 300.0, 500)
+        for octaves in (1, 6, 8):
+            expected = [snoise2(x, y, octaves, base=123) for x, y in zip(xs, ys)]
+            self.assertEqual(expected, snoise2_array(xs, ys, octaves, base=123).tolist())
+
+    def test_noise_field_matches_snoise2(self):
+        height, width = 13, 29
+        freq = 128.0
+        n_scale = 1024 / float(height)
+        field = noise_field((height, width), freq, 8, 42, scale=n_scale, x_offset=width)
+        for y in range(height):
+            for x in range(width):
+                self.assertEqual(snoise2(((x * n_scale) + width) / freq, (y * n_scale) / freq, 8, base=42),
+                                 field[y, x])
+
+    def test_wrapped_noise_field(self):
+        height, width = 7, 18
+        border = width / 4.0  # 4.5
+        for include_border, seam in ((False, 5), (True, 5)):
+            field = wrapped_noise_field((height, width), 32.0, 4, 7, border,
+                                        include_border=include_border)
+            for y in range(height):
+                for x in range(width):
+                    n = snoise2(x / 32.0, y / 32.0, 4, base=7)
+                    if x < seam:
+                        n = n * x / border + snoise2((x + width) / 32.0, y / 32.0, 4, base=7) \
+                            * (border - x) / border
+                    self.assertEqual(n, field[y, x])
+        # with an integer border, the column x == border is only blended on request
+        field = wrapped_noise_field((height, 16), 32.0, 4, 7, 4, include_border=False)
+        self.assertEqual(noise_field((height, 16), 32.0, 4, 7)[:, 4].tolist(), field[:, 4].tolist())
+
+    def test_noise_field_invalid_octaves(self):
+        self.assertRaises(ValueError, noise_field, (4, 4), 16.0, 0, 0)
+
+if __name__ == '__main__':
+    unittest.main()
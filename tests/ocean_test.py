@@ -0,0 +1,94 @@
+import unittest
+
+import numpy
+
+from worldengine.common import anti_alias
+from worldengine.generation import distance_to_land, fill_ocean, sea_depth
+from worldengine.model.world import World
+
+
+class TestOcean(unittest.TestCase):
+
+    @staticmethod
+    def _cell_by_cell(elevation, sea_level):
+        # the original implementation, expanding one cell at a time from the borders
+        height, width = elevation.shape
+        ocean = numpy.zeros(elevation.shape, dtype=bool)
+        to_expand = [(y, x) for y in range(height) for x in range(width)
+                     if (y in (0, height - 1) or x in (0, width - 1))
+                     and elevation[y, x] <= sea_level]
+        for y, x in to_expand:
+            if not ocean[y, x]:
+                ocean[y, x] = True
+                for py in range(max(0, y - 1), min(height, y + 2)):
+                    for px in range(max(0, x - 1), min(width, x + 2)):
+                        if not ocean[py, px] and elevation[py, px] <= sea_level:
+                            to_expand.append((py, px))
+        return ocean
+
+    def test_fill_ocean(self):
+        elevation = numpy.array([[0.5, 0.5, 2.0, 0.5, 0.5],
+                                 [2.0, 2.0, 2.0, 2.0, 0.5],
+                                 [2.0, 0.5, 0.5, 2.0, 2.0],
+                                 [2.0, 2.0, 2.0, 0.5, 2.0],
+                                 [2.0, 2.0, 2.0, 2.0, 2.0]])
+        expected = numpy.array([[True, True, False, True, True],
+                                [False, False, False, False, True],
+                                [False, False, False, False, False],
+                                [False, False, False, False, False],
+                                [False, False, False, False, False]])
+        self.assertTrue(numpy.array_equal(expected, fill_ocean(elevation, 1.0)))
+
+        # diagonal neighbours connect the inland cells to the ocean
+        elevation[1, 3] = 0.5
+        expected[1, 3] = expected[2, 2] = expected[2, 1] = expected[3, 3] = True
+        self.assertTrue(numpy.array_equal(expected, fill_ocean(elevation, 1.0)))
+
+    def test_fill_ocean_matches_cell_by_cell(self):
+        rng = numpy.random.RandomState(11)
+        elevation = rng.uniform(0.0, 2.0, size=(40, 60))
+        numpy.testing.assert_array_equal(self._cell_by_cell(elevation, 1.0),
+                                         fill_ocean(elevation, 1.0))
+
+    def test_distance_to_land(self):
+        ocean = numpy.full([7, 9], True)
+        ocean[3, 2] = False
+
+        expected = numpy.asarray([[3, 3, 3, 3, 3, 3, -1, -1, -1],
+                                  [2, 2, 2, 2, 2, 3, -1, -1, -1],
+                                  [2, 1, 1, 1, 2, 3, -1, -1, -1],
+                                  [2, 1, 0, 1, 2, 3, -1, -1, -1],
+                                  [2, 1, 1, 1, 2, 3, -1, -1, -1],
+                                  [2, 2, 2, 2, 2, 3, -1, -1, -1],
+                                  [3, 3, 3, 3, 3, 3, -1, -1, -1]])
+        self.assertTrue(numpy.array_equal(expected, distance_to_land(ocean, max_radius=3)))
+
+    def test_sea_depth(self):
+        extent = 11
+        w = World("sea_depth", extent, extent, 0, 25.0, 10, 1.0,
+                  [.874, .765, .594, .439, .366, .124],
+                  [.941, .778, .507, .236, 0.073, .014, .002], 1.25, .2)
+        ocean = numpy.full([extent, extent], True)
+        ocean[5, 5] = False
+        elevation = numpy.zeros([extent, extent])
+        elevation[5, 5] = 2.0
+        w.elevation = (elevation, None)
+        w.ocean = ocean
+
+        # the depth (1.0 at sea) attenuated by the distance to land, which
+        # is the chessboard distance to the center
+        y, x = numpy.mgrid[0:extent, 0:extent]
+        distance = numpy.maximum(abs(y - 5), abs(x - 5))
+        for factors in [(0.0, 0.3, 0.5, 0.7, 0.9), (0.2, 0.6)]:
+            lookup = numpy.ones(extent)
+            lookup[1:len(factors) + 1] = factors
+            desired_result = lookup[distance]
+            desired_result[5, 5] = -1.0
+            desired_result = anti_alias(desired_result, 10)
+            desired_result = (desired_result - desired_result.min()) / \
+                (desired_result.max() - desired_result.min())
+            numpy.testing.assert_allclose(desired_result, sea_depth(w, 1.0, factors),
+                                          rtol=0, atol=1e-12)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,98 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy
+
+from worldengine import profiling
+from worldengine.profiling import GenerationReport, Measurement, measure
+
+
+class TestProfiling(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_measure_without_report(self):
+        with measure(None, 'step') as m:
+            numpy.zeros(10)
+        self.assertEqual('step', m.name)
+        self.assertTrue(m.wall_time >= 0)
+        self.assertIsNone(m.peak_memory)  # memory is not traced
+
+    def test_peak_memory_of_nested_measurements(self):
+        report = GenerationReport()
+        report.start()
+        try:
+            with report.measure('outer') as outer:
+                with Measurement('inner') as inner:
+                    a = numpy.ones(1000000)  # 8 MB
+                    del a
+                b = numpy.ones(10000)
+                del b
+        finally:
+            report.stop()
+        self.assertTrue(inner.peak_memory >= 8000000)
+        # the peak reached by the inner block counts for the outer one too
+        self.assertTrue(outer.peak_memory >= inner.peak_memory)
+        self.assertEqual([outer], report.measurements)
+
+    def test_peak_memory_without_reset_peak(self):
+        # before Python 3.9 a block only gets a peak it reached itself
+        tracemalloc = profiling.tracemalloc
+
+        class NoResetPeak(object):
+            is_tracing = staticmethod(tracemalloc.is_tracing)
+            get_traced_memory = staticmethod(tracemalloc.get_traced_memory)
+            start = staticmethod(tracemalloc.start)
+            stop = staticmethod(tracemalloc.stop)
+
+        report = GenerationReport()
+        profiling.tracemalloc = NoResetPeak
+        report.start()
+        try:
+            with Measurement('high') as high:
+                a = numpy.ones(1000000)  # 8 MB
+                del a
+            with Measurement('low') as low:
+                b = numpy.ones(10000)
+        finally:
+            report.stop()
+            profiling.tracemalloc = tracemalloc
+        self.assertTrue(high.peak_memory >= 8000000)
+        self.assertTrue(0 <= low.peak_memory < 8000000)
+        del b
+
+    def test_tracing_started_within_a_measurement(self):
+        with Measurement('batch') as outer:
+            report = GenerationReport()
+            report.start()
+            try:
+                with report.measure('stage') as inner:
+                    numpy.ones(1000)
+            finally:
+                report.stop()
+        self.assertIsNotNone(inner.peak_memory)
+        self.assertIsNone(outer.peak_memory)
+
+    def test_save(self):
+        report = GenerationReport({'seed': 3})
+        with report.measure('stage') as m:
+            pass
+        m.outputs['layer'] = 128
+        filename = os.path.join(self.directory, 'report.json')
+        report.save(filename)
+        with open(filename) as f:
+            data = json.load(f)
+        self.assertEqual({'seed': 3}, data['description'])
+        self.assertEqual(1, len(data['measurements']))
+        self.assertEqual('stage', data['measurements'][0]['name'])
+        self.assertEqual({'layer': 128}, data['measurements'][0]['outputs'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,103 @@
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+import numpy
+
+from worldengine.cache import StageCache
+from worldengine.generation import STAGES
+from worldengine.model.world import Layer, Layers
+from worldengine.scheduler import deferrable, run_stages, stage_dependencies
+
+# import global logger
+import worldengine.logger as logger
+
+
+class _World(object):
+
+    def __init__(self):
+        self.layers = Layers(a=Layer(numpy.arange(4.0)))
+
+
+class _Double(object):
+    reads = ('a',)
+    writes = ('b',)
+
+    def execute(self, world, seed):
+        world.layers['b'] = Layer(world.layers['a'].data * 2)
+        return seed
+
+
+class _Scale(object):
+    reads = ('a',)
+    writes = ('b',)
+
+    def __init__(self, factor=2):
+        self.factor = factor
+
+    def execute(self, world, seed):
+        world.layers['b'] = Layer(world.layers['a'].data * self.factor)
+
+
+class TestScheduler(unittest.TestCase):
+
+    def _dependencies(self):
+        names = [s.__name__ for s in STAGES]
+        deps = stage_dependencies(STAGES)
+        return dict((names[j], set(names[i] for i in deps[j])) for j in range(len(names)))
+
+    def test_independent_stages(self):
+        deps = self._dependencies()
+        self.assertEqual(set(), deps['TemperatureSimulation'])
+        self.assertEqual(set(), deps['PermeabilitySimulation'])
+        self.assertEqual({'TemperatureSimulation'}, deps['IcecapSimulation'])
+
+    def test_dependencies_through_modified_layers(self):
+        deps = self._dependencies()
+        # erosion changes the elevation temperature has been computed from...
+        self.assertIn('TemperatureSimulation', deps['ErosionSimulation'])
+        # ...and the watermap must see the eroded elevation
+        self.assertIn('ErosionSimulation', deps['WatermapSimulation'])
+        self.assertEqual({'TemperatureSimulation', 'MoistureSimulation'},
+                         deps['BiomeSimulation'])
+
+    def test_deferrable_stages(self):
+        names = set(STAGES[i].__name__ for i in deferrable(STAGES))
+        self.assertEqual({'PermeabilitySimulation', 'IcecapSimulation'}, names)
+
+    def test_serial_without_concurrent_futures(self):
+        if not hasattr(logger, 'logger'):  # the stages log as they finish
+            logger.logger = logging.getLogger(__name__)
+        world = _World()
+        futures = sys.modules.get('concurrent.futures')
+        sys.modules['concurrent.futures'] = None  # import concurrent.futures fails
+        try:
+            results = run_stages(world, [_Double], {'_Double': 5}, jobs=2)
+        finally:
+            if futures is None:
+                del sys.modules['concurrent.futures']
+            else:
+                sys.modules['concurrent.futures'] = futures
+        self.assertEqual({'_Double': 5}, results)
+        self.assertEqual([0.0, 2.0, 4.0, 6.0], list(world.layers['b'].data))
+
+    def test_options_are_part_of_the_cache_key(self):
+        if not hasattr(logger, 'logger'):  # the stages log as they finish
+            logger.logger = logging.getLogger(__name__)
+        directory = tempfile.mkdtemp()
+        try:
+            cache = StageCache(directory)
+            for factor, expected in ((3, 9.0), (5, 15.0), (3, 9.0)):
+                world = _World()
+                run_stages(world, [_Scale], {'_Scale': 1}, cache=cache, cache_key='w',
+                           options={'_Scale': {'factor': factor}})
+                self.assertEqual(expected, world.layers['b'].data[3])
+            self.assertEqual(2, len(os.listdir(directory)))
+        finally:
+            shutil.rmtree(directory)
+
+if __name__ == '__main__':
+    unittest.main()
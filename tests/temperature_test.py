@@ -0,0 +1,51 @@
+import unittest
+
+import numpy
+from noise import snoise2
+
+from worldengine.model.world import World
+from worldengine.simulations.temperature import TemperatureSimulation
+
+
+class TestTemperatureSimulation(unittest.TestCase):
+
+    def test_temperature_matches_cell_by_cell(self):
+        seed = 7
+        w = World("temperature", 20, 10, seed, 25.0, 10, 1.0,
+                  [.874, .765, .594, .439, .366, .124],
+                  [.941, .778, .507, .236, 0.073, .014, .002], 1.25, .2)
+        mountain_level = 10.0
+        # below, between and above the mountain level plus 29
+        elevation = numpy.fromfunction(lambda y, x: (x + y) * 2.5, (10, 20))
+        self.assertTrue((elevation > mountain_level + 29).any())
+
+        data = TemperatureSimulation._calculate(w, seed, elevation, mountain_level)
+
+        rng = numpy.random.RandomState(seed)
+        base = rng.randint(0, 4096)
+        axial_tilt = 25.0 / 360
+        distance_to_sun = max(0.1, rng.normal(loc=1.0, scale=0.12 / 1.177410023)) ** 2
+        width, height = 20, 10
+        border = width / 4
+        freq = 16.0 * 8
+        n_scale = 1024 / float(height)
+        for y in range(height):
+            latitude_factor = numpy.interp(float(y) / height - 0.5,
+                                           [axial_tilt - 0.5, axial_tilt, axial_tilt + 0.5],
+                                           [0.0, 1.0, 0.0], left=0.0, right=0.0)
+            for x in range(width):
+                n = snoise2((x * n_scale) / freq, (y * n_scale) / freq, 8, base=base)
+                if x <= border:
+                    n = (n * x / border) \
+                        + (snoise2(((x * n_scale) + width) / freq, (y * n_scale) / freq, 8,
+                                   base=base) * (border - x) / border)
+                t = (latitude_factor * 12 + n * 1) / 13.0 / distance_to_sun
+                if elevation[y, x] > mountain_level:
+                    if elevation[y, x] > mountain_level + 29:
+                        t *= 0.033
+                    else:
+                        t *= 1.00 - float(elevation[y, x] - mountain_level) / 30
+                self.assertAlmostEqual(data[y, x], t, places=12)
+
+if __name__ == '__main__':
+    unittest.main()
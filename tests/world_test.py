@@ -0,0 +1,44 @@
+import pickle
+import unittest
+
+import numpy
+
+from worldengine.model.world import Layer, Layers
+
+
+class TestLayers(unittest.TestCase):
+
+    def setUp(self):
+        self.calls = 0
+        self.layers = Layers(elevation=Layer(numpy.zeros((2, 3))))
+
+        def _produce():
+            self.calls += 1
+            self.layers['icecap'] = Layer(numpy.ones((2, 3)))
+        self.layers.add_lazy(['icecap'], _produce)
+
+    def test_produced_on_first_access(self):
+        self.assertIn('icecap', self.layers)
+        self.assertTrue(self.layers.is_lazy('icecap'))
+        self.assertEqual({'elevation'}, set(self.layers.materialized()))
+        self.assertEqual(0, self.calls)
+        self.assertEqual(1.0, self.layers['icecap'].data.max())
+        self.layers['icecap']
+        self.assertEqual(1, self.calls)
+        self.assertFalse(self.layers.is_lazy('icecap'))
+
+    def test_listing_does_not_produce(self):
+        self.assertEqual({'elevation', 'icecap'}, set(self.layers.keys()))
+        self.assertEqual(2, len(self.layers))
+        del self.layers['icecap']
+        self.assertNotIn('icecap', self.layers)
+        self.assertEqual(0, self.calls)
+
+    def test_pickling_produces(self):
+        unpickled = pickle.loads(pickle.dumps(self.layers))
+        self.assertEqual(1, self.calls)
+        self.assertEqual(self.layers['icecap'], unpickled['icecap'])
+        self.assertFalse(unpickled.is_lazy('icecap'))
+
+if __name__ == '__main__':
+    unittest.main()
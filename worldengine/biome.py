@@ -24,6 +24,16 @@ class _BiomeMetaclass(type):
         return created_class
 
 
+_names = []
+
+
+def _sorted_names():
+    # new biomes can be defined by subclassing Biome, after this module is loaded
+    if len(_names) != len(_BiomeMetaclass.biomes):
+        _names[:] = sorted(_BiomeMetaclass.biomes.keys())
+    return _names
+
+
 class Biome(with_metaclass(_BiomeMetaclass, object)):
 
     @classmethod
@@ -34,7 +44,7 @@ class Biome(with_metaclass(_BiomeMetaclass, object)):
 
     @classmethod
     def all_names(cls):
-        return sorted(_BiomeMetaclass.biomes.keys())
+        return list(_sorted_names())
 
     @classmethod
     def name(cls):
@@ -268,8 +278,17 @@ class TropicalRainForest(Biome, Jungle):
 # Serialization
 # -------------
 
+# The biome layer of a world holds, for every cell, the index of its biome:
+# its position among the names of all the biomes, sorted (see
+# biome_name_to_index), stored as uint8.
+
+# index of the cells in no temperature band (NaN temperatures, or ranges
+# given out of order), which are not a Biome
+BARE_ROCK = 255
+
+
 def biome_name_to_index(biome_name):
-    names = sorted(_BiomeMetaclass.biomes.keys())
+    names = _sorted_names()
     for i in range(len(names)):
         if names[i] == biome_name:
             return i
@@ -277,7 +296,17 @@ def biome_name_to_index(biome_name):
 
 
 def biome_index_to_name(biome_index):
-    names = sorted(_BiomeMetaclass.biomes.keys())
+    names = _sorted_names()
     if not 0 <= biome_index < len(names):
         raise Exception("Not found")
     return names[biome_index]
+
+
+def biome_group_indices():
+    """
+    :return: the indices of the biomes of every BiomeGroup, by the name of
+             the group
+    """
+    return dict((_un_camelize(group.__name__),
+                 [biome_name_to_index(biome.name()) for biome in group.__subclasses__()])
+                for group in BiomeGroup.__subclasses__())
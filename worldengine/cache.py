@@ -0,0 +1,135 @@
+"""
+On-disk cache of the output of the generation stages.
+
+Every entry holds what a stage produced: its return value, the layers it
+wrote and, if it drew from it, the state of the global numpy RNG afterwards.
+Entries are addressed by a key combining everything the output depends on
+(see StageCache.key); when the directory grows beyond its size budget the
+least recently used entries are evicted.
+"""
+
+import hashlib
+import os
+import pickle
+import tempfile
+
+import numpy
+
+from worldengine.version import __version__
+
+_SUFFIX = '.stage'
+
+
+def _update_digest(digest, value):
+    if isinstance(value, numpy.ndarray):
+        digest.update(repr((value.dtype.str, value.shape)).encode('utf-8'))
+        digest.update(numpy.ascontiguousarray(value).tobytes())
+    elif isinstance(value, (list, tuple)):
+        digest.update(('%s%i' % (type(value).__name__, len(value))).encode('utf-8'))
+        for v in value:
+            _update_digest(digest, v)
+    elif isinstance(value, dict):
+        digest.update(('dict%i' % len(value)).encode('utf-8'))
+        for k in sorted(value, key=repr):
+            _update_digest(digest, k)
+            _update_digest(digest, value[k])
+    else:
+        digest.update(repr(value).encode('utf-8'))
+
+
+def world_key(world):
+    """
+    Key describing the current content of a world: its generation parameters,
+    its layers and the state of the global RNG (the hydrology draws from it).
+    Lazy layers not produced yet are left out, they derive from the others.
+    """
+    layers = dict((name, (layer.data, getattr(layer, 'thresholds', None),
+                          getattr(layer, 'quantiles', None)))
+                  for name, layer in world.layers.materialized().items())
+    return StageCache.key(world.seed, world.size, world.axial_tilt, world.n_plates,
+                          world.ocean_level, world.temperature_ranges, world.moisture_ranges,
+                          world.gamma_value, world.gamma_offset, layers,
+                          numpy.random.get_state())
+
+
+def _replace(source, destination):
+    """
+    os.replace, which Python < 3.3 does not have: os.rename instead, which on
+    Windows fails if destination exists, it is then removed first (readers
+    may miss the entry in the meantime)
+    """
+    if hasattr(os, 'replace'):
+        os.replace(source, destination)
+        return
+    try:
+        os.rename(source, destination)
+    except OSError:
+        try:
+            os.remove(destination)
+        except OSError:
+            pass
+        os.rename(source, destination)
+
+
+class StageCache(object):
+
+    def __init__(self, directory, max_size=2 * 1024 ** 3):
+        """
+        :param directory: where entries are stored, created if missing
+        :param max_size: budget in bytes for all the entries together
+        """
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        self.directory = directory
+        self.max_size = max_size
+
+    @staticmethod
+    def key(*parts):
+        """Digest of the given values (numbers, strings, arrays and nested
+        lists, tuples and dictionaries of those) and of the version."""
+        digest = hashlib.sha1()
+        _update_digest(digest, __version__)
+        _update_digest(digest, parts)
+        return digest.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + _SUFFIX)
+
+    def load(self, key):
+        """
+        :return: the entry stored under key, or None if there is none
+        """
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                entry = pickle.load(f)
+        except (IOError, OSError, EOFError, pickle.UnpicklingError):
+            return None
+        os.utime(path, None)  # mark as recently used
+        return entry
+
+    def store(self, key, entry):
+        fd, tmp_path = tempfile.mkstemp(suffix='.tmp', dir=self.directory)
+        with os.fdopen(fd, 'wb') as f:
+            pickle.dump(entry, f, pickle.HIGHEST_PROTOCOL)
+        _replace(tmp_path, self._path(key))  # readers never see partial entries
+        self._evict()
+
+    def _evict(self):
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith(_SUFFIX):
+                try:
+                    st = os.stat(os.path.join(self.directory, name))
+                except OSError:  # evicted by someone else in the meantime
+                    continue
+                entries.append((st.st_mtime, st.st_size, name))
+        total = sum(size for _, size, _ in entries)
+        for _, size, name in sorted(entries):
+            if total <= self.max_size:
+                break
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except OSError:
+                pass
+            total -= size
@@ -5,6 +5,10 @@ import argparse
 
 import numpy
 
+from worldengine.simulations.hydrology import WatermapSimulation
+from worldengine.simulations.icecap import IcecapSimulation
+from worldengine.simulations.moisture import MoistureSimulation
+
 import worldengine.logger as logger
 
 class Parser():
@@ -86,6 +90,22 @@ exactly 7 floating point values')
 
         return moisture_ranges
 
+    # used for validation of the number of parallel jobs
+    def jobs(self, jobs):
+        jobs = int(jobs)
+        if jobs < 1:
+            raise argparse.ArgumentTypeError('Number of jobs should be a \
+positive int')
+        return jobs
+
+    # used for validation of the cache size
+    def cache_size(self, size):
+        size = float(size)
+        if size <= 0:
+            raise argparse.ArgumentTypeError('Cache size should be a positive \
+number of megabytes')
+        return size
+
     # used for seed validation
     def seed(self, seed):
         seed = int(seed)
@@ -94,12 +114,28 @@ exactly 7 floating point values')
 [0, 65535]')
         return seed
 
+    # used for validation of the seeds of a batch, e.g. 1-5000 or 3,7,10-12
+    def seeds(self, seeds):
+        result = []
+        for part in str(seeds).split(','):
+            bounds = part.split('-')
+            if len(bounds) > 2:
+                raise argparse.ArgumentTypeError('Seeds should be a comma \
+separated list of seeds and ranges of seeds, such as 1-5000')
+            first, last = self.seed(bounds[0]), self.seed(bounds[-1])
+            if first > last:
+                raise argparse.ArgumentTypeError('Range of seeds %s is empty' % part)
+            result.extend(range(first, last + 1))
+        return result
+
     def __init__(self):
 
         self.parser = argparse.ArgumentParser(
             usage="%(prog)s [options]")
 
-        self.parser.add_argument('FILE', nargs='?')
+        self.parser.add_argument('FILE', nargs='?',
+                                 help='batch: generate one world per seed \
+of --seeds')
 
         # exposing output directory
         self.parser.add_argument('-o', '--output-dir', dest = 'output_dir',
@@ -116,6 +152,14 @@ generation.',
                                  default = numpy.random.randint(0, 65535),
                                  type = self.seed)
 
+        # exposing the seeds of a batch
+        self.parser.add_argument('--seeds', dest = 'seeds',
+                                 metavar = '%d-%d',
+                                 help = 'Seeds of the worlds generated in \
+batch, e.g. 1-5000 or 3,7,10-12; with batch, --jobs is the number of worlds \
+generated in parallel processes',
+                                 type = self.seeds)
+
         # exposing worldname
         # TODO: dangerous uses of seed defined above.
         self.parser.add_argument('-n', '--worldname', dest = 'name',
@@ -200,6 +244,48 @@ temperature/precipitation gamma correction curve. [default = %(default)s]',
                                 help="Not fade borders",
                                 default=True)
 
+        generation_args.add_argument('-j', '--jobs', dest='jobs',
+                                     metavar='%d >= 1',
+                                     help='Number of simulations that may run \
+in parallel processes [default = %(default)s]',
+                                     default=1, type=self.jobs)
+
+        generation_args.add_argument('--watermap-engine', dest='watermap_engine',
+                                     choices=WatermapSimulation.ENGINES,
+                                     help='How the watermap is computed: \
+following random droplets, by flow accumulation or moving all the droplets \
+at once [default = %(default)s]',
+                                     default='droplet')
+
+        generation_args.add_argument('--icecap-mode', dest='icecap_mode',
+                                     choices=IcecapSimulation.MODES,
+                                     help='How the ice caps are drawn: one \
+random number per freezable tile, as in previous versions, or a random field \
+for the whole map at once [default = %(default)s]',
+                                     default='legacy')
+
+        generation_args.add_argument('--moisture-dtype', dest='moisture_dtype',
+                                     choices=MoistureSimulation.DTYPES,
+                                     help='Type of the values of the moisture \
+layer, float32 halves its memory [default = %(default)s]',
+                                     default='float64')
+
+        generation_args.add_argument('--cache-dir', dest='cache_dir',
+                                     metavar='DIR',
+                                     help='Keep the output of every generation \
+stage in DIR and reuse it when generating the same world again')
+
+        generation_args.add_argument('--cache-size', dest='cache_size',
+                                     metavar='%f > 0',
+                                     help='Size budget of the cache in MB, the \
+least recently used entries are evicted [default = %(default)s]',
+                                     default=2048, type=self.cache_size)
+
+        generation_args.add_argument('--report', dest='report',
+                                     metavar='FILE',
+                                     help='Write the time and memory spent in \
+every generation step to FILE, as JSON')
+
         generation_args.add_argument('--scatter', dest='scatter_plot',
                                 action="store_true", help="generate scatter plot")
 
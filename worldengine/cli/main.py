@@ -1,16 +1,22 @@
 # -*- coding: UTF-8 -*-
 
+import copy
+import os
+import sys
+import traceback
 from argparse import ArgumentTypeError
 
 import numpy
 
 import worldengine.generation as geo
+from worldengine.cache import StageCache
 from worldengine.draw import draw_biome_on_file, draw_ocean_on_file, \
     draw_precipitation_on_file, draw_grayscale_heightmap_on_file, draw_simple_elevation_on_file, \
     draw_temperature_levels_on_file, draw_riversmap_on_file, draw_scatter_plot_on_file, \
     draw_satellite_on_file, draw_icecaps_on_file
 from worldengine.imex import export
 from worldengine.model.world import World
+from worldengine.profiling import GenerationReport, Measurement, measure
 from worldengine.simulations.plates import world_gen, generate_plates_simulation
 from worldengine.version import __version__
 
@@ -21,12 +27,20 @@ from args_parser import Parser
 
 VERSION = __version__
 
+def _draw(report, draw_function, target, filename, *args, **kwargs):
+    with measure(report, draw_function.__name__) as measurement:
+        draw_function(target, filename, *args, **kwargs)
+    measurement.outputs[filename] = os.path.getsize(filename)
+
+
 def generate_world(name, width, height, seed, n_plates, output_dir,
                    ocean_level, temperature_ranges, moisture_ranges, axial_tilt,
-                   gamma_value=1.25, gamma_offset=.2, fade_borders=True, black_and_white=False):
+                   gamma_value=1.25, gamma_offset=.2, fade_borders=True, black_and_white=False,
+                   jobs=1, cache=None, report=None, stage_options=None):
     w = world_gen(name, width, height, axial_tilt, seed, temperature_ranges, moisture_ranges, n_plates, ocean_level,
                   gamma_value=gamma_value, gamma_offset=gamma_offset,
-                  fade_borders=fade_borders)
+                  fade_borders=fade_borders, jobs=jobs, cache=cache, report=report,
+                  stage_options=stage_options)
 
     # TODO: serialization if temporarly disabled must be reenabled
     # Save data
@@ -37,56 +51,228 @@ def generate_world(name, width, height, seed, n_plates, output_dir,
 
     # Generate images
     filename = '%s/%s_ocean.png' % (output_dir, name)
-    draw_ocean_on_file(w.layers['ocean'].data, filename)
+    _draw(report, draw_ocean_on_file, w.layers['ocean'].data, filename)
 
     filename = '%s/%s_precipitation.png' % (output_dir, name)
-    draw_precipitation_on_file(w, filename, black_and_white)
+    _draw(report, draw_precipitation_on_file, w, filename, black_and_white)
 
     filename = '%s/%s_temperature.png' % (output_dir, name)
-    draw_temperature_levels_on_file(w, filename, black_and_white)
+    _draw(report, draw_temperature_levels_on_file, w, filename, black_and_white)
 
     filename = '%s/%s_biome.png' % (output_dir, name)
-    draw_biome_on_file(w, filename)
+    _draw(report, draw_biome_on_file, w, filename)
 
     filename = '%s/%s_elevation.png' % (output_dir, name)
     sea_level = w.sea_level()
-    draw_simple_elevation_on_file(w, filename, sea_level=sea_level)
+    _draw(report, draw_simple_elevation_on_file, w, filename, sea_level=sea_level)
     return w
 
 
-def generate_grayscale_heightmap(world, filename):
-    draw_grayscale_heightmap_on_file(world, filename)
+def generate_grayscale_heightmap(world, filename, report=None):
+    _draw(report, draw_grayscale_heightmap_on_file, world, filename)
+
 
+def generate_rivers_map(world, filename, report=None):
+    _draw(report, draw_riversmap_on_file, world, filename)
 
-def generate_rivers_map(world, filename):
-    draw_riversmap_on_file(world, filename)
 
+def draw_scatter_plot(world, filename, report=None):
+    _draw(report, draw_scatter_plot_on_file, world, filename)
 
-def draw_scatter_plot(world, filename):
-    draw_scatter_plot_on_file(world, filename)
 
+def draw_satellite_map(world, filename, report=None):
+    _draw(report, draw_satellite_on_file, world, filename)
 
-def draw_satellite_map(world, filename):
-    draw_satellite_on_file(world, filename)
 
+def draw_icecaps_map(world, filename, report=None):
+    _draw(report, draw_icecaps_on_file, world, filename)
 
-def draw_icecaps_map(world, filename):
-    draw_icecaps_on_file(world, filename)
+
+def _generate(args):
+    """Generate the world of args.seed, with its images, as main() does."""
+    # applying seed for numpy pseudo random seed
+    numpy.random.seed(args.seed)
+
+    cache = None
+    if args.cache_dir:
+        cache = StageCache(args.cache_dir, int(args.cache_size * 1024 * 1024))
+
+    stage_options = {'WatermapSimulation': {'engine': args.watermap_engine},
+                     'MoistureSimulation': {'dtype': args.moisture_dtype},
+                     'IcecapSimulation': {'mode': args.icecap_mode}}
+
+    report = None
+    if args.report:
+        report = GenerationReport({'name': args.name, 'seed': args.seed,
+                                   'width': args.width, 'height': args.height,
+                                   'n_plates': args.n_plates, 'jobs': args.jobs,
+                                   'stage_options': stage_options})
+        report.start()
+
+    try:
+        world = generate_world(args.name, args.width, args.height,
+                               args.seed, args.n_plates, args.output_dir,
+                               args.ocean_level, args.temperature_ranges,
+                               args.moisture_ranges, args.axial_tilt,
+                               gamma_value=args.gamma_value, gamma_offset=args.gamma_offset,
+                               fade_borders=args.fade_borders, black_and_white=args.black_and_white,
+                               jobs=args.jobs, cache=cache, report=report,
+                               stage_options=stage_options)
+        if args.grayscale_heightmap:
+            generate_grayscale_heightmap(world,
+                                         '%s/%s_grayscale.png' % (args.output_dir, args.name),
+                                         report)
+        generate_rivers_map(world,
+                            '%s/%s_rivers.png' % (args.output_dir, args.name), report)
+
+        if args.scatter_plot:
+            draw_scatter_plot(world,
+                              '%s/%s_scatter.png' % (args.output_dir, args.name), report)
+        if args.satelite_map:
+            draw_satellite_map(world,
+                               '%s/%s_satellite.png' % (args.output_dir, args.name), report)
+        if args.icecaps_map:
+            draw_icecaps_map(world,
+                             '%s/%s_icecaps.png' % (args.output_dir, args.name), report)
+    finally:
+        if report is not None:
+            report.stop()
+
+    if report is not None:
+        report.save(args.report)
+        logger.logger.info('Generation report saved in %s' % args.report)
+    return world
+
+
+def _generate_seed(args):
+    """
+    Runs in a worker process of a batch: generate one world, never raise.
+    :return: the seed, the wall time spent and the error message if the
+             generation failed (None otherwise)
+    """
+    if not hasattr(logger, 'logger'):  # not inherited from the parent process
+        logger.init()
+    with Measurement(args.name) as measurement:
+        try:
+            _generate(args)
+            error = None
+        except Exception:
+            error = traceback.format_exc()
+    return args.seed, measurement.wall_time, error
+
+
+def _run_alone(task):
+    """
+    Runs a task in a process pool of its own: should its worker die, the
+    task is the one which killed it.
+    :return: the status of the task, see _generate_seed
+    """
+    import concurrent.futures
+    from concurrent.futures.process import BrokenProcessPool
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=1) as pool:
+        try:
+            return pool.submit(_generate_seed, task).result()
+        except BrokenProcessPool:
+            return task.seed, None, 'the worker process died (crashed or killed)'
+
+
+def _batch(args, seeds):
+    """
+    Generate the world of every seed, each in a task of a process pool, each
+    one exactly as a single run with that seed would. The status of every
+    world is logged as it finishes; a world failing does not stop the others.
+    At most args.jobs tasks are submitted at a time: if a worker dies, which
+    breaks the pool, the tasks submitted are run again one by one, each in a
+    pool of its own, and the remaining ones in a new pool. Without
+    concurrent.futures (Python 2 without the futures backport) the worlds
+    are generated one after the other.
+    :return: the list of (seed, wall time, error message or None) in the
+             order the worlds finished
+    """
+    tasks = []
+    for seed in seeds:
+        task = copy.copy(args)
+        task.seed = seed
+        task.name = '%s_%i' % (args.name, seed) if args.name else 'seed_%i' % seed
+        task.jobs = 1  # the pool already keeps every process busy
+        if args.report:
+            root, ext = os.path.splitext(args.report)
+            task.report = '%s_%i%s' % (root, seed, ext)
+        tasks.append(task)
+
+    statuses = []
+
+    def _done(status):
+        seed, wall_time, error = status
+        statuses.append(status)
+        if error is None:
+            logger.logger.info('[%i/%i] seed %i done. Elapsed time %f seconds.'
+                               % (len(statuses), len(tasks), seed, wall_time))
+        else:
+            logger.logger.error('[%i/%i] seed %i failed:\n%s'
+                                % (len(statuses), len(tasks), seed, error))
+
+    try:
+        import concurrent.futures
+        from concurrent.futures.process import BrokenProcessPool
+    except ImportError:
+        for task in tasks:
+            _done(_generate_seed(task))
+        return statuses
+
+    queue = list(reversed(tasks))  # the next one last
+    while queue:
+        suspects = []  # the tasks submitted to a broken pool
+        with concurrent.futures.ProcessPoolExecutor(max_workers=args.jobs) as pool:
+            running = {}
+            while (queue or running) and not suspects:
+                while queue and len(running) < args.jobs:
+                    task = queue.pop()
+                    try:
+                        running[pool.submit(_generate_seed, task)] = task
+                    except BrokenProcessPool:
+                        suspects.append(task)
+                        break
+                if not running:
+                    break
+                finished, _ = concurrent.futures.wait(
+                    running, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in finished:
+                    task = running.pop(future)
+                    try:
+                        _done(future.result())
+                    except BrokenProcessPool:
+                        suspects.append(task)
+            if suspects:  # the pool is broken, the tasks still running fail too
+                suspects.extend(running.values())
+        for task in sorted(suspects, key=lambda t: tasks.index(t)):
+            _done(_run_alone(task))
+    return statuses
 
 
 def main():
     # initializing logger
     logger.init()
 
-    # parse arguments
+    # parse arguments
     parser = Parser().parser
     args = parser.parse_args()
 
     # logging cli arguments on debug
     logger.logger.debug('cli args: {}'.format(vars(args)))
 
-    # applying seed for numpy pseudo random seed
-    numpy.random.seed(args.seed)
+    if args.FILE == 'batch':
+        if not args.seeds:
+            parser.error('batch requires --seeds')
+        statuses = _batch(args, args.seeds)
+        failed = sorted(seed for seed, _, error in statuses if error is not None)
+        logger.logger.info('... batch done, %i worlds generated, %i failed%s'
+                           % (len(statuses) - len(failed), len(failed),
+                              (': %s' % ', '.join(str(s) for s in failed)) if failed else ''))
+        if failed:
+            sys.exit(1)
+        return
 
     # defining world name
     if not args.name:
@@ -96,27 +282,7 @@ def main():
 
     #world = World(args.name, args.width, args.height, args.seed, args.axial_tilt, args.n_plates, args.ocean_level, args.temp, args.moisture_ranges, args.gamma_value, args.gamma_offset)
 
-    world = generate_world(args.name, args.width, args.height,
-                           args.seed, args.n_plates, args.output_dir,
-                           args.ocean_level, args.temperature_ranges,
-                           args.moisture_ranges, args.axial_tilt,
-                           gamma_value=args.gamma_value, gamma_offset=args.gamma_offset,
-                           fade_borders=args.fade_borders, black_and_white=args.black_and_white)
-    if args.grayscale_heightmap:
-        generate_grayscale_heightmap(world,
-                                     '%s/%s_grayscale.png' % (args.output_dir, args.name))
-    generate_rivers_map(world,
-                        '%s/%s_rivers.png' % (args.output_dir, args.name))
-
-    if args.scatter_plot:
-        draw_scatter_plot(world,
-                          '%s/%s_scatter.png' % (args.output_dir, args.name))
-    if args.satelite_map:
-        draw_satellite_map(world,
-                           '%s/%s_satellite.png' % (args.output_dir, args.name))
-    if args.icecaps_map:
-        draw_icecaps_map(world,
-                         '%s/%s_icecaps.png' % (args.output_dir, args.name))
+    _generate(args)
 
     logger.logger.debug('... generation done')
 
@@ -54,6 +54,17 @@ class Counter(object):
 #
 # Unless we want to add scipy as a dependency we only have 1D convolution at our hands from numpy.
 # So we take advantage of the kernel being seperable.
+#
+# Because the operation is linear and shift-invariant (with wrap-around boundaries)
+# all the steps can be collapsed into a single one: in the frequency domain each step
+# multiplies by the transfer function r of the 3x3 kernel and adds (2/11)*map, so after
+# n steps the map has been multiplied by
+#
+#   r^n + (2/11) * (1 + r + ... + r^(n-1)) = r^n + (2/11) * (1 - r^n) / (1 - r)
+#
+# r lies in [-3/11, 9/11], so the geometric sum never divides by zero.
+# anti_alias() applies that product with a single FFT-based circular convolution,
+# _anti_alias_iterative() is the original step by step implementation.
 
 def anti_alias(map_in, steps):
     """
@@ -62,6 +73,27 @@ def anti_alias(map_in, steps):
 
     height, width = map_in.shape
 
+    # the 3x3 kernel, wrapped around the map (taps may coincide on tiny maps)
+    kernel = numpy.zeros((height, width))
+    for dy in range(-1, 2):
+        for dx in range(-1, 2):
+            kernel[dy % height, dx % width] += 1.0/11.0
+
+    r = numpy.fft.rfft2(kernel).real  # the kernel is symmetric
+    r_n = numpy.power(r, steps)
+    transfer = r_n + (2.0/11.0) * (1.0 - r_n) / (1.0 - r)
+
+    return numpy.fft.irfft2(numpy.fft.rfft2(map_in) * transfer, s=(height, width))
+
+
+def _anti_alias_iterative(map_in, steps):
+    """
+    Execute the anti_alias operation steps times on the given map, one step
+    at a time
+    """
+
+    height, width = map_in.shape
+
     map_part = (2.0/11.0)*map_in
 
     # notice how [-1/sqrt(3), -1/sqrt(3), -1/sqrt(3)] * [-1/sqrt(3), -1/sqrt(3), -1/sqrt(3)]^T
@@ -130,6 +162,18 @@ def count_neighbours(mask, radius=1):
     return result - mask
 
 
+def in_values(data, values):
+    """
+    :return: a boolean array shaped like data, True where data holds one of
+             values (numpy.isin, which numpy < 1.13 does not have; numpy.in1d
+             is gone from numpy 2.4)
+    """
+    data = numpy.asarray(data)
+    if hasattr(numpy, 'isin'):
+        return numpy.isin(data, values)
+    return numpy.in1d(data.ravel(), values).reshape(data.shape)
+
+
 def _equal(a, b):
     #recursion on subclasses of types: tuple, list, dict
     #specifically checks             : float, ndarray
@@ -1,5 +1,6 @@
 import numpy
 
+from worldengine.biome import Biome
 from worldengine.drawing_functions import draw_rivers_on_image
 from worldengine.image_io import PNGWriter
 
@@ -90,6 +91,12 @@ _biome_colors = {
     'tropical very dry forest': (160, 255, 128),
 }
 
+
+def _colors_by_biome_index(colors):
+    """:return: the given colors of the biomes, by index in the biome layer"""
+    return [colors[name] for name in Biome.all_names()]
+
+
 # These colors are used when drawing the satellite view map
 # The rgb values were hand-picked from an actual high-resolution
 # satellite map of earth. However, many values are either too similar
@@ -568,11 +575,13 @@ def draw_world(world, target):
     width = world.size.width
     height = world.size.height
 
+    biome = world.layers['biome'].data
+    colors = _colors_by_biome_index(_biome_colors)
+
     for y in range(height):
         for x in range(width):
             if world.is_land((x, y)):
-                biome = world.biome_at((x, y))
-                target.set_pixel(x, y, _biome_colors[biome.name()])
+                target.set_pixel(x, y, colors[biome[y, x]])
             else:
                 c = int(world.layers['sea_depth'].data[y, x] * 200 + 50)
                 target.set_pixel(x, y, (0, 0, 255 - c, 255))
@@ -618,11 +627,11 @@ def draw_biome(world, target):
     height = world.size.height
 
     biome = world.layers['biome'].data
+    colors = _colors_by_biome_index(_biome_colors)
 
     for y in range(height):
         for x in range(width):
-            v = biome[y, x]
-            target.set_pixel(x, y, _biome_colors[v])
+            target.set_pixel(x, y, colors[biome[y, x]])
 
 
 def draw_scatter_plot(world, size, target):
@@ -8,9 +8,9 @@ import numpy
 import sys
 import time
 
-from worldengine.common import count_neighbours
+from worldengine.common import count_neighbours, in_values
 from worldengine.common import anti_alias as anti_alias_channel
-from worldengine.biome import BiomeGroup, _un_camelize
+from worldengine.biome import biome_group_indices
 
 # import global logger
 import worldengine.logger as logger
@@ -80,15 +80,10 @@ def _find_mountains_mask(world, factor):
 
 def _build_biome_group_masks(world, factor):
 
-    biome_groups = BiomeGroup.__subclasses__()
-
     biome_masks = {}
 
-    for group in biome_groups:
-        group_mask = numpy.zeros((world.size.height, world.size.width), float)
-
-        for biome in group.__subclasses__():
-            group_mask[world.biome==_un_camelize(biome.__name__)] += 1.0
+    for group, indices in biome_group_indices().items():
+        group_mask = in_values(world.biome, indices).astype(float)
 
         group_mask[group_mask>0] = count_neighbours(group_mask)[group_mask>0]
 
@@ -96,7 +91,7 @@ def _build_biome_group_masks(world, factor):
 
         group_mask = group_mask.repeat(factor, 0).repeat(factor, 1)
 
-        biome_masks[_un_camelize(group.__name__)] = group_mask
+        biome_masks[group] = group_mask
 
     return biome_masks
 
@@ -1,8 +1,7 @@
 import numpy
 
-from noise import snoise2
-
-from worldengine.simulations.basic import find_threshold_f
+from worldengine.noise_fields import noise_field
+from worldengine.simulations.basic import find_thresholds
 from worldengine.simulations.hydrology import WatermapSimulation
 from worldengine.simulations.irrigation import IrrigationSimulation
 from worldengine.simulations.moisture import MoistureSimulation
@@ -13,6 +12,8 @@ from worldengine.simulations.precipitation import PrecipitationSimulation
 from worldengine.simulations.biome import BiomeSimulation
 from worldengine.simulations.icecap import IcecapSimulation
 from worldengine.common import anti_alias
+from worldengine.cache import world_key
+from worldengine.scheduler import run_stages
 
 # import global logger
 import worldengine.logger as logger
@@ -67,49 +68,57 @@ def place_oceans_at_map_borders(world):
 def add_noise_to_elevation(world, seed):
     octaves = 8
     freq = 16.0 * octaves
-    for y in range(world.size.height):
-        for x in range(world.size.width):
-            n = snoise2(x / freq * 2, y / freq * 2, octaves, base=seed)
-            world.layers['elevation'].data[y, x] += n
+    world.layers['elevation'].data += noise_field(
+        world.layers['elevation'].data.shape, freq, octaves, seed, scale=2.0)
 
 
-def fill_ocean(elevation, sea_level):#TODO: Make more use of numpy?
+def fill_ocean(elevation, sea_level):
+    """
+    Flood fill the ocean starting from the borders of the map: every cell at
+    or below sea level that is 8-connected to a border cell at or below sea
+    level is ocean. The fill advances one whole frontier at a time.
+    """
     height, width = elevation.shape
 
-    ocean = numpy.zeros(elevation.shape, dtype=bool)
-    to_expand = []
-    for x in range(width):#handle top and bottom border of the map
-        if elevation[0, x] <= sea_level:
-            to_expand.append((x, 0))
-        if elevation[height - 1, x] <= sea_level:
-            to_expand.append((x, height - 1))
-    for y in range(height):#handle left- and rightmost border of the map
-        if elevation[y, 0] <= sea_level:
-            to_expand.append((0, y))
-        if elevation[y, width - 1] <= sea_level:
-            to_expand.append((width - 1, y))
-    for t in to_expand:
-        tx, ty = t
-        if not ocean[ty, tx]:
-            ocean[ty, tx] = True
-            for px, py in _around(tx, ty, width, height):
-                if not ocean[py, px] and elevation[py, px] <= sea_level:
-                    to_expand.append((px, py))
-
-    return ocean
+    # work on a padded copy so that the neighbours of every cell are valid
+    # indices; the padding is never a candidate, hence never expanded into
+    candidates = numpy.zeros((height + 2, width + 2), dtype=bool)
+    candidates[1:-1, 1:-1] = elevation <= sea_level
+    ocean = numpy.zeros(candidates.shape, dtype=bool)
+
+    stride = width + 2
+    offsets = numpy.array([-stride - 1, -stride, -stride + 1,
+                           -1, 1,
+                           stride - 1, stride, stride + 1])
+
+    border = numpy.zeros(candidates.shape, dtype=bool)
+    border[1, 1:-1] = border[-2, 1:-1] = True  # top and bottom border of the map
+    border[1:-1, 1] = border[1:-1, -2] = True  # left- and rightmost border of the map
+    frontier = numpy.flatnonzero(numpy.logical_and(border, candidates))
+    ocean.flat[frontier] = True
+
+    while frontier.size > 0:
+        neighbours = (frontier[:, numpy.newaxis] + offsets).ravel()
+        neighbours = neighbours[candidates.flat[neighbours]]
+        neighbours = neighbours[numpy.logical_not(ocean.flat[neighbours])]
+        frontier = numpy.unique(neighbours)
+        ocean.flat[frontier] = True
+
+    return ocean[1:-1, 1:-1].copy()
 
 
 def initialize_ocean_and_thresholds(world, ocean_level=1.0):
     """
-    Calculate the ocean, the sea depth and the elevation thresholds
+    Calculate the ocean and the elevation thresholds, and register the sea
+    depth (see add_lazy_sea_depth)
     :param world: a world having elevation but not thresholds
     :param ocean_level: the elevation representing the ocean level
     :return: nothing, the world will be changed
     """
     e = world.layers['elevation'].data
     ocean = fill_ocean(e, ocean_level)
-    hl = find_threshold_f(e, 0.10)  # the highest 10% of all (!) land are declared hills
-    ml = find_threshold_f(e, 0.03)  # the highest 3% are declared mountains
+    # the highest 10% of all (!) land are declared hills, the highest 3% mountains
+    hl, ml = find_thresholds(e, [0.10, 0.03])
     e_th = [('sea', ocean_level),
             ('plain', hl),
             ('hill', ml),
@@ -117,7 +126,7 @@ def initialize_ocean_and_thresholds(world, ocean_level=1.0):
     harmonize_ocean(ocean, e, ocean_level)
     world.ocean = ocean
     world.elevation = (e, e_th)
-    world.sea_depth = sea_depth(world, ocean_level)
+    add_lazy_sea_depth(world, ocean_level)
 
 
 def harmonize_ocean(ocean, elevation, ocean_level):
@@ -141,50 +150,69 @@ def harmonize_ocean(ocean, elevation, ocean_level):
 # Misc
 # ----
 
-def sea_depth(world, sea_level):
+def distance_to_land(ocean, max_radius=5):
+    """
+    Chessboard distance from every cell to the next land cell, computed by
+    growing the land one ring at a time with whole-array operations; the
+    cost is linear in max_radius.
+    :param ocean: the ocean mask
+    :param max_radius: the maximum distance looked at
+    :return: 0 for land cells and -1 for cells further than max_radius away
+             from land
+    """
+    next_land = numpy.full(ocean.shape, -1, int)
+
+    # non ocean tiles are zero distance away from next land
+    reached = numpy.logical_not(ocean)
+    next_land[reached] = 0
+
+    for dist in range(1, max_radius + 1):
+        # dilate by one cell in every direction, first along x then along y
+        grown = reached.copy()
+        grown[:, 1:] |= reached[:, :-1]
+        grown[:, :-1] |= reached[:, 1:]
+        reached = grown.copy()
+        reached[1:, :] |= grown[:-1, :]
+        reached[:-1, :] |= grown[1:, :]
 
-    # a dynamic programming approach to gather how far the next land is
-    # from a given coordinate up to a maximum distance of max_radius
-    # result is 0 for land coordinates and -1 for coordinates further than
-    # max_radius away from land
-    # there might be even faster ways but it does the trick
+        next_land[numpy.logical_and(reached, next_land == -1)] = dist
+    return next_land
 
-    def next_land_dynamic(ocean, max_radius=5):
 
-        next_land = numpy.full(ocean.shape, -1, int)
+def sea_depth(world, sea_level, factors=(0.0, 0.3, 0.5, 0.7, 0.9)):
+    """
+    :param factors: the raw sea depth of a cell that is d cells away from the
+                    next land is multiplied by factors[d - 1]; cells further
+                    away than len(factors) are left as they are
+    """
+    return _sea_depth(world.layers['elevation'].data, world.layers['ocean'].data,
+                      sea_level, factors)
 
-        # non ocean tiles are zero distance away from next land
-        next_land[numpy.logical_not(ocean)]=0
 
-        height, width = ocean.shape
+def add_lazy_sea_depth(world, sea_level):
+    """
+    Register the sea depth of the world as a lazy layer, only computed if
+    it is ever needed (e.g. when the world is saved). It is computed from
+    the elevation as it is now, later simulations changing it.
+    """
+    elevation = world.layers['elevation'].data.copy()
+    ocean = world.layers['ocean'].data
 
-        for dist in range(max_radius):
-            indices = numpy.transpose(numpy.where(next_land==dist))
-            for y, x in indices:
-                for dy in range(-1, 2):
-                    ny = y + dy
-                    if 0 <= ny < height:
-                        for dx in range(-1, 2):
-                            nx = x + dx
-                            if 0 <= nx < width:
-                                if next_land[ny,nx] == -1:
-                                    next_land[ny,nx] = dist + 1
-        return next_land
+    def _produce():
+        world.sea_depth = _sea_depth(elevation, ocean, sea_level)
+    world.layers.add_lazy(['sea_depth'], _produce)
 
-    # We want to multiply the raw sea_depth by one of these factors
-    # depending on the distance from the next land
-    # possible TODO: make this a parameter
-    factors = [0.0, 0.3, 0.5, 0.7, 0.9]
 
-    next_land = next_land_dynamic(world.layers['ocean'].data)
+def _sea_depth(elevation, ocean, sea_level, factors=(0.0, 0.3, 0.5, 0.7, 0.9)):
+    next_land = distance_to_land(ocean, len(factors))
 
-    sea_depth = sea_level - world.layers['elevation'].data
+    # lookup table indexed by next_land: land (0) and far away cells (-1,
+    # i.e. the last entry) keep their depth
+    depth_factors = numpy.ones(len(factors) + 2)
+    depth_factors[1:-1] = factors
 
-    for y in range(world.size.height):
-        for x in range(world.size.width):
-            dist_to_next_land = next_land[y,x]
-            if dist_to_next_land > 0:
-                sea_depth[y,x]*=factors[dist_to_next_land-1]
+    sea_depth = sea_level - elevation
+    sea_depth *= depth_factors[next_land]
 
     sea_depth = anti_alias(sea_depth, 10)
 
@@ -195,19 +223,26 @@ def sea_depth(world, sea_level):
     return sea_depth
 
 
-def _around(x, y, width, height):
-    ps = []
-    for dx in range(-1, 2):
-        nx = x + dx
-        if 0 <= nx < width:
-            for dy in range(-1, 2):
-                ny = y + dy
-                if 0 <= ny < height and (dx != 0 or dy != 0):
-                    ps.append((nx, ny))
-    return ps
+# The simulations run by generate_world, in their sequential order. Running
+# them one after the other in this order is always valid; with jobs > 1
+# independent ones run at the same time (cf. worldengine.scheduler).
+STAGES = [TemperatureSimulation,
+          PrecipitationSimulation,
+          ErosionSimulation,
+          WatermapSimulation,
+          IrrigationSimulation,
+          MoistureSimulation,
+          PermeabilitySimulation,
+          BiomeSimulation,
+          IcecapSimulation]
 
 
-def generate_world(w):
+def generate_world(w, jobs=1, executor='process', cache=None, report=None, stage_options=None):
+    """
+    :param stage_options: the keyword arguments of the constructor of the
+                          simulations, by class name, e.g.
+                          {'WatermapSimulation': {'engine': 'particles'}}
+    """
     # Prepare sufficient seeds for the different steps of the generation
     rng = numpy.random.RandomState(w.seed)  # create a fresh RNG in case the global RNG is compromised (i.e. has been queried an indefinite amount of times before generate_world() was called)
     sub_seeds = rng.randint(0, numpy.iinfo(numpy.int32).max, size=100)  # choose lowest common denominator (32 bit Windows numpy cannot handle a larger value)
@@ -224,23 +259,16 @@ def generate_world(w):
                  '':                        sub_seeds[99]
     }
 
-    TemperatureSimulation().execute(w, seed_dict['TemperatureSimulation'])
-    # Precipitation with thresholds
-    PrecipitationSimulation().execute(w, seed_dict['PrecipitationSimulation'])
-
-    ErosionSimulation().execute(w, seed_dict['ErosionSimulation'])  # seed not currently used
-
-    logger.logger.debug('...erosion calculated')
+    cache_key = world_key(w) if cache is not None else None
+    results = run_stages(w, STAGES, seed_dict, jobs, executor, cache, cache_key, report,
+                         stage_options)
 
-    WatermapSimulation().execute(w, seed_dict['WatermapSimulation'])  # seed not currently used
+    stats = results['WatermapSimulation']
+    if stats is not None:  # the work done by the particles engine
+        logger.logger.debug('Watermap: %(droplets)i droplets, %(particle_steps)i particle '
+                            'steps in %(rounds)i rounds' % stats)
 
-    # FIXME: create setters
-    IrrigationSimulation().execute(w, seed_dict['IrrigationSimulation'])  # seed not currently used
-    MoistureSimulation().execute(w, seed_dict['MoistureSimulation'])  # seed not currently used
-
-    PermeabilitySimulation().execute(w, seed_dict['PermeabilitySimulation'])
-
-    cm, biome_cm = BiomeSimulation().execute(w, seed_dict['BiomeSimulation'])  # seed not currently used
+    cm, biome_cm = results['BiomeSimulation']
     for cl in cm.keys():
         count = cm[cl]
         logger.logger.debug('.%s = %i' % (str(cl), count))
@@ -254,6 +282,4 @@ def generate_world(w):
             distrib_str += ' ({:.3f}% emerged surface)'.format(float(count) / (sum(biome_cm.values()) - biome_cm['ocean']) * 100)
     logger.logger.debug(distrib_str)
 
-    IcecapSimulation().execute(w, seed_dict['IcecapSimulation'])  # makes use of temperature-map
-
     return w
@@ -1,3 +1,5 @@
+import threading
+
 import numpy
 
 from collections import namedtuple
@@ -56,6 +58,103 @@ class LayerWithQuantiles(Layer):
             return False
 
 
+# producing a lazy layer may require producing another one first
+_lazy_lock = threading.RLock()
+
+
+class Layers(dict):
+    """
+    The layers of a world, by name. Besides the layers themselves it can
+    hold lazy layers: a producer registered with add_lazy is called, without
+    arguments, the first time one of its layers is looked up, and has to set
+    all of them. Lazy layers are listed and tested for like the others;
+    looking them up, through items(), values() or serialization as well,
+    produces them.
+    """
+
+    def __init__(self, *args, **kwargs):
+        dict.__init__(self)
+        self._producers = {}
+        self.update(*args, **kwargs)
+
+    def add_lazy(self, names, producer):
+        for name in names:
+            if dict.__contains__(self, name):
+                dict.__delitem__(self, name)
+            self._producers[name] = producer
+
+    def is_lazy(self, name):
+        """:return: whether the layer is still to be produced"""
+        return name in self._producers
+
+    def materialized(self):
+        """:return: a dictionary of the layers already produced"""
+        return dict(dict.items(self))
+
+    def __getitem__(self, name):
+        if name in self._producers:
+            with _lazy_lock:
+                producer = self._producers.get(name)
+                if producer is not None:
+                    # while it runs, the layers it produces are not there yet
+                    for produced in [n for n, p in self._producers.items() if p is producer]:
+                        del self._producers[produced]
+                    producer()
+                    if not dict.__contains__(self, name):
+                        raise KeyError("The producer of %s did not set it" % name)
+        return dict.__getitem__(self, name)
+
+    def __setitem__(self, name, layer):
+        self._producers.pop(name, None)
+        dict.__setitem__(self, name, layer)
+
+    def __delitem__(self, name):
+        if self._producers.pop(name, None) is None:
+            dict.__delitem__(self, name)
+
+    def __contains__(self, name):
+        return dict.__contains__(self, name) or name in self._producers
+
+    def __iter__(self):
+        for name in list(dict.keys(self)) + list(self._producers):
+            yield name
+
+    def __len__(self):
+        return dict.__len__(self) + len(self._producers)
+
+    def keys(self):
+        return list(self)
+
+    def items(self):
+        return [(name, self[name]) for name in list(self)]
+
+    def values(self):
+        return [self[name] for name in list(self)]
+
+    def get(self, name, default=None):
+        return self[name] if name in self else default
+
+    def pop(self, name, *default):
+        if name in self:
+            layer = self[name]
+            del self[name]
+            return layer
+        if default:
+            return default[0]
+        raise KeyError(name)
+
+    def update(self, *args, **kwargs):
+        for name, layer in dict(*args, **kwargs).items():
+            self[name] = layer
+
+    def copy(self):
+        return Layers(self.items())
+
+    def __reduce__(self):
+        # producers are not picklable, layers are produced before pickling
+        return Layers, (self.items(),)
+
+
 class World(object):
     """A world composed by name, dimensions and all the characteristics of
     each cell.
@@ -83,7 +182,7 @@ class World(object):
         self.axial_tilt = axial_tilt
         self.n_plates = n_plates
         self.ocean_level = ocean_level
-        self.layers = {}
+        self.layers = Layers()
     #
     # General methods
     #
@@ -216,7 +315,7 @@ class World(object):
         self._to_protobuf_matrix(self.layers['ocean'].data, p_world.ocean)
         self._to_protobuf_matrix(self.layers['sea_depth'].data, p_world.sea_depth)
 
-        self._to_protobuf_matrix(self.layers['biome'].data, p_world.biome, biome_name_to_index)
+        self._to_protobuf_matrix(self.layers['biome'].data, p_world.biome)
 
         self._to_protobuf_matrix_with_quantiles(self.layers['moisture'], p_world.moisture)
 
@@ -276,7 +375,7 @@ class World(object):
 
         # Biome
         if len(p_world.biome.rows) > 0:
-            w.biome = numpy.array(World._from_protobuf_matrix(p_world.biome, biome_index_to_name), dtype=object)
+            w.biome = numpy.array(World._from_protobuf_matrix(p_world.biome), dtype=numpy.uint8)
 
         # Moisture
         if len(p_world.moisture.rows) > 0:
@@ -627,7 +726,7 @@ class World(object):
 
     def biome_at(self, pos):
         x, y = pos
-        b = Biome.by_name(self.layers['biome'].data[y, x])
+        b = Biome.by_name(biome_index_to_name(self.layers['biome'].data[y, x]))
         if b is None:
             raise Exception('Not found')
         return b
@@ -689,6 +788,9 @@ class World(object):
 
     @biome.setter
     def biome(self, biome):
+        # the layer holds indices (see worldengine.biome.biome_name_to_index)
+        if biome.dtype.kind in 'OSU':  # names
+            biome = numpy.vectorize(biome_name_to_index, otypes=[numpy.uint8])(biome)
         if biome.shape[0] != self.size.height:
             raise Exception(
                 "Setting data with wrong height: biome has height %i while "
@@ -696,7 +798,7 @@ class World(object):
                     biome.shape[0], self.size.height))
         if biome.shape[1] != self.size.width:
             raise Exception("Setting data with wrong width")
-        self.layers['biome'] = Layer(biome)
+        self.layers['biome'] = Layer(biome.astype(numpy.uint8, copy=False))
 
     @property
     def ocean(self):
@@ -750,7 +852,7 @@ class World(object):
     def moisture(self, val):
         try:
             data, quantiles = val
-            data = numpy.array(data)
+            data = numpy.asarray(data)  # not copied, the layer can be large
         except ValueError:
             raise ValueError("Pass an iterable: (data, quantiles)")
         else:
@@ -0,0 +1,169 @@
+"""
+Whole-grid 2D simplex noise.
+
+The functions in this module compute the very same values as noise.snoise2
+(flat, non-tiled variant) but for whole numpy arrays at once, instead of one
+interpreter round-trip per cell. The C implementation works in single
+precision; every operation below is carried out in float32 and in the same
+order, so results are bit-identical and existing seeds reproduce.
+"""
+
+import math
+
+import numpy
+
+# skew factors, cf. noise/_simplex.c
+_F2 = numpy.float32(0.3660254037844386)  # 0.5 * (sqrt(3.0) - 1.0)
+_G2 = numpy.float32(0.21132486540518713)  # (3.0 - sqrt(3.0)) / 6.0
+
+# only the x- and y-components of the gradients are used by 2D noise
+_GRAD3_X = numpy.array([1, -1, 1, -1, 1, -1, 1, -1, 0, 0, 0, 0], dtype=numpy.float32)
+_GRAD3_Y = numpy.array([1, 1, -1, -1, 0, 0, 0, 0, 1, -1, 1, -1], dtype=numpy.float32)
+
+_PERM = numpy.array([
+    151, 160, 137, 91, 90, 15, 131, 13, 201, 95, 96, 53, 194, 233, 7, 225, 140,
+    36, 103, 30, 69, 142, 8, 99, 37, 240, 21, 10, 23, 190, 6, 148, 247, 120,
+    234, 75, 0, 26, 197, 62, 94, 252, 219, 203, 117, 35, 11, 32, 57, 177, 33,
+    88, 237, 149, 56, 87, 174, 20, 125, 136, 171, 168, 68, 175, 74, 165, 71,
+    134, 139, 48, 27, 166, 77, 146, 158, 231, 83, 111, 229, 122, 60, 211, 133,
+    230, 220, 105, 92, 41, 55, 46, 245, 40, 244, 102, 143, 54, 65, 25, 63, 161,
+    1, 216, 80, 73, 209, 76, 132, 187, 208, 89, 18, 169, 200, 196, 135, 130,
+    116, 188, 159, 86, 164, 100, 109, 198, 173, 186, 3, 64, 52, 217, 226, 250,
+    124, 123, 5, 202, 38, 147, 118, 126, 255, 82, 85, 212, 207, 206, 59, 227,
+    47, 16, 58, 17, 182, 189, 28, 42, 223, 183, 170, 213, 119, 248, 152, 2, 44,
+    154, 163, 70, 221, 153, 101, 155, 167, 43, 172, 9, 129, 22, 39, 253, 19, 98,
+    108, 110, 79, 113, 224, 232, 178, 185, 112, 104, 218, 246, 97, 228, 251, 34,
+    242, 193, 238, 210, 144, 12, 191, 179, 162, 241, 81, 51, 145, 235, 249, 14,
+    239, 107, 49, 192, 214, 31, 181, 199, 106, 157, 184, 84, 204, 176, 115, 121,
+    50, 45, 127, 4, 150, 254, 138, 236, 205, 93, 222, 114, 67, 29, 24, 72, 243,
+    141, 128, 195, 78, 66, 215, 61, 156, 180], dtype=numpy.intp)
+_PERM = numpy.concatenate((_PERM, _PERM))
+
+# number of cells evaluated at once; bounds the size of the temporaries
+_BLOCK_CELLS = 1 << 18
+
+
+def _corner(xx, yy, g):
+    f = numpy.float32(0.5) - xx * xx - yy * yy
+    n = f * f * f * f * (_GRAD3_X[g] * xx + _GRAD3_Y[g] * yy)
+    n[f <= 0] = 0
+    return n
+
+
+def _noise2(x, y):
+    """Single octave of simplex noise, x and y being float32 arrays."""
+    s = (x + y) * _F2
+    i = numpy.floor(x + s)
+    j = numpy.floor(y + s)
+    t = (i + j) * _G2
+
+    xx0 = x - (i - t)
+    yy0 = y - (j - t)
+
+    i1 = xx0 > yy0
+    j1 = numpy.logical_not(i1)
+
+    xx2 = xx0 + _G2 * numpy.float32(2.0) - numpy.float32(1.0)
+    yy2 = yy0 + _G2 * numpy.float32(2.0) - numpy.float32(1.0)
+    xx1 = xx0 - i1.astype(numpy.float32) + _G2
+    yy1 = yy0 - j1.astype(numpy.float32) + _G2
+
+    I = i.astype(numpy.intp) & 255
+    J = j.astype(numpy.intp) & 255
+    g0 = _PERM[I + _PERM[J]] % 12
+    g1 = _PERM[I + i1 + _PERM[J + j1]] % 12
+    g2 = _PERM[I + 1 + _PERM[J + 1]] % 12
+
+    total = _corner(xx0, yy0, g0)
+    total += _corner(xx1, yy1, g1)
+    total += _corner(xx2, yy2, g2)
+    total *= numpy.float32(70.0)
+    return total
+
+
+def snoise2_array(x, y, octaves=1, persistence=0.5, lacunarity=2.0, base=0):
+    """
+    Vectorized counterpart of noise.snoise2: x and y are arrays (or scalars)
+    broadcastable against each other, the result is a float64 array holding
+    snoise2(x, y, octaves, persistence, lacunarity, base=base) per element.
+    """
+    if octaves <= 0:
+        raise ValueError("Expected octaves value > 0")
+
+    x, y = numpy.broadcast_arrays(numpy.asarray(x, dtype=numpy.float32),
+                                  numpy.asarray(y, dtype=numpy.float32))
+    z = numpy.float32(base)
+    persistence = numpy.float32(persistence)
+    lacunarity = numpy.float32(lacunarity)
+
+    freq = numpy.float32(1.0)
+    amp = numpy.float32(1.0)
+    max_amp = numpy.float32(1.0)
+    total = _noise2(x + z, y + z)
+    for _ in range(1, octaves):
+        freq *= lacunarity
+        amp *= persistence
+        max_amp += amp
+        total += _noise2(x * freq + z, y * freq + z) * amp
+    total /= max_amp
+    return total.astype(float)
+
+
+def noise_field(shape, freq, octaves, base, scale=1.0, x_offset=0.0,
+                persistence=0.5, lacunarity=2.0):
+    """
+    Evaluate simplex noise on a whole grid in one call.
+    :param shape: (height, width) of the resulting array
+    :param freq: the cell coordinates are divided by this value
+    :param octaves: number of passes of snoise2
+    :param base: the base (seed) of the noise
+    :param scale: the cell coordinates are multiplied by this value first
+    :param x_offset: added to the scaled x-coordinate, used to sample
+                     the noise past the right border of the map
+    :return: a float64 array with
+             field[y, x] == snoise2((x * scale + x_offset) / freq,
+                                    (y * scale) / freq, octaves, base=base)
+    """
+    height, width = shape
+    # coordinates are computed in double precision, exactly as the callers
+    # of snoise2 did, and only then rounded to single precision
+    xs = (numpy.arange(width, dtype=float) * scale + x_offset) / freq
+    ys = (numpy.arange(height, dtype=float) * scale) / freq
+
+    field = numpy.empty((height, width), dtype=float)
+    rows = max(1, _BLOCK_CELLS // max(1, width))
+    for y0 in range(0, height, rows):
+        y1 = min(y0 + rows, height)
+        field[y0:y1] = snoise2_array(xs[numpy.newaxis, :], ys[y0:y1, numpy.newaxis],
+                                     octaves, persistence, lacunarity, base)
+    return field
+
+
+def wrapped_noise_field(shape, freq, octaves, base, border, scale=1.0,
+                        include_border=False, persistence=0.5, lacunarity=2.0):
+    """
+    Noise field blending into itself across the left and right borders of the
+    map, so that it wraps horizontally. Over the first columns (x < border,
+    or x <= border with include_border) the field fades from the noise found
+    past the right border of the map, (x + width), into its own values:
+
+        field[y, x] = noise(x, y) * x / border
+                      + noise(x + width, y) * (border - x) / border
+
+    Both fields are evaluated once per sample, the second one only over the
+    blended columns. Parameters are the ones of noise_field.
+    """
+    height, width = shape
+    field = noise_field(shape, freq, octaves, base, scale=scale,
+                        persistence=persistence, lacunarity=lacunarity)
+
+    if include_border:
+        seam = int(math.floor(border)) + 1
+    else:
+        seam = int(math.ceil(border))
+    seam = min(seam, width)
+    xs = numpy.arange(seam)
+    field[:, :seam] = field[:, :seam] * xs / border \
+        + noise_field((height, seam), freq, octaves, base, scale=scale, x_offset=width,
+                      persistence=persistence, lacunarity=lacunarity) * (border - xs) / border
+    return field
@@ -0,0 +1,174 @@
+"""
+Instrumentation of the generation.
+
+A Measurement records the wall time, the CPU time and the peak memory of the
+block it wraps, together with the size of what the block produced (layers,
+files). A GenerationReport collects the measurements of a whole generation:
+the plates simulation, every stage of generate_world and every image drawn,
+and writes them as JSON.
+
+Memory is measured with tracemalloc, which numpy reports its arrays to, and
+only while a report is tracing: it slows down allocation-heavy Python code.
+There is no tracemalloc before Python 3.4, the peak memory is then None;
+before Python 3.9 the peak cannot be reset, a block which does not exceed
+the highest memory traced before it only gets the memory in use when it ends.
+CPU time is the one of the whole process, so stages running in threads next
+to each other (see worldengine.scheduler) see each other's CPU time and
+allocations.
+"""
+
+import json
+import threading
+import time
+
+try:
+    import tracemalloc
+except ImportError:  # Python < 3.4
+    tracemalloc = None
+
+from worldengine.version import __version__
+
+try:
+    _wall_clock, _cpu_clock = time.perf_counter, time.process_time
+except AttributeError:  # Python < 3.3
+    _wall_clock, _cpu_clock = time.time, time.clock
+
+# measurements being taken, innermost last, with the memory traced when
+# entering them and the highest amount of traced memory seen so far
+_active = threading.local()
+
+
+def _stack():
+    if not hasattr(_active, 'stack'):
+        _active.stack = []
+    return _active.stack
+
+
+def is_tracing():
+    """:return: whether memory is being traced"""
+    return tracemalloc is not None and tracemalloc.is_tracing()
+
+
+def start_tracing():
+    """Start tracing memory, if it is not already and can be."""
+    if tracemalloc is not None and not tracemalloc.is_tracing():
+        tracemalloc.start()
+
+
+def _traced_peak(floor):
+    """
+    :return: the highest memory traced since the peak was last reset, if
+             above floor (the peak when it could not be reset); the memory
+             in use otherwise
+    """
+    current, peak = tracemalloc.get_traced_memory()
+    return peak if peak > floor else current
+
+
+class Measurement(object):
+
+    def __init__(self, name):
+        self.name = name
+        self.wall_time = None
+        self.cpu_time = None
+        # in bytes, on top of the memory in use when the block started
+        self.peak_memory = None
+        # size in bytes of every output, by name
+        self.outputs = {}
+        self.cached = False
+
+    def add_layers(self, layers):
+        """Record the size of the data of the given layers (by name)."""
+        for name, layer in layers.items():
+            self.outputs[name] = int(layer.data.nbytes)
+
+    def __enter__(self):
+        stack = _stack()
+        if is_tracing():
+            if stack and stack[-1][1] is not None:
+                # the peak is shared, keep the one of the enclosing block
+                stack[-1][2] = max(stack[-1][2], _traced_peak(stack[-1][3]))
+            if hasattr(tracemalloc, 'reset_peak'):  # Python >= 3.9
+                tracemalloc.reset_peak()
+                floor = -1
+            else:
+                floor = tracemalloc.get_traced_memory()[1]
+            current = tracemalloc.get_traced_memory()[0]
+            stack.append([self, current, current, floor])
+        else:
+            stack.append([self, None, None, None])
+        self._start = (_wall_clock(), _cpu_clock())
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        wall_start, cpu_start = self._start
+        self.wall_time = _wall_clock() - wall_start
+        self.cpu_time = _cpu_clock() - cpu_start
+        del self._start
+
+        stack = _stack()
+        _, base, peak, floor = stack.pop()
+        if base is not None and is_tracing():
+            peak = max(peak, _traced_peak(floor))
+            self.peak_memory = peak - base
+            if stack and stack[-1][1] is not None:
+                stack[-1][2] = max(stack[-1][2], peak)
+        return False
+
+    def as_dict(self):
+        return {'name': self.name, 'wall_time': self.wall_time,
+                'cpu_time': self.cpu_time, 'peak_memory': self.peak_memory,
+                'outputs': self.outputs, 'cached': self.cached}
+
+
+def measure(report, name):
+    """
+    :return: report.measure(name), or a Measurement which is not recorded
+             anywhere when report is None
+    """
+    if report is None:
+        return Measurement(name)
+    return report.measure(name)
+
+
+class GenerationReport(object):
+
+    def __init__(self, description=None, trace_memory=True):
+        """
+        :param description: a JSON-serializable dictionary describing the
+                            generation (name, seed, size...)
+        :param trace_memory: whether peak memory is measured, tracemalloc
+                             is started by start() when it is
+        """
+        self.description = description or {}
+        self.trace_memory = trace_memory
+        self.measurements = []
+        self._started_tracing = False
+
+    def start(self):
+        if self.trace_memory and tracemalloc is not None and not is_tracing():
+            start_tracing()
+            self._started_tracing = True
+
+    def stop(self):
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+
+    def measure(self, name):
+        """:return: a new Measurement, recorded in this report"""
+        measurement = Measurement(name)
+        self.measurements.append(measurement)
+        return measurement
+
+    def add(self, measurement):
+        """Record a measurement taken elsewhere (e.g. in a worker process)."""
+        self.measurements.append(measurement)
+
+    def as_dict(self):
+        return {'version': __version__, 'description': self.description,
+                'measurements': [m.as_dict() for m in self.measurements]}
+
+    def save(self, filename):
+        with open(filename, 'w') as f:
+            json.dump(self.as_dict(), f, indent=2, sort_keys=True)
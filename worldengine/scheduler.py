@@ -0,0 +1,275 @@
+"""
+Runs the simulations of generate_world according to their dependencies.
+
+Every simulation class declares the layers it reads and the layers it
+writes (`reads` and `writes`). Given the order in which the simulations are
+listed, a simulation depends on an earlier one whenever running them the
+other way round could change a result: it reads a layer the earlier one
+writes, it writes a layer the earlier one reads, or both write the same
+layer. Simulations without a dependency between them can run at the same
+time.
+
+Each simulation draws its random numbers from its own seed, so the results
+do not depend on the order in which independent simulations finish. The
+global numpy RNG is handed over explicitly when running on a process pool;
+at most one simulation (the watermap, with its droplet engine) is expected
+to draw from it.
+
+A simulation declaring `lazy = True` is not executed right away: its layers
+are registered as lazy layers of the world (see worldengine.model.world.Layers)
+and it only runs if one of them is ever needed. It must not draw from the
+global RNG, and is only deferred when no later simulation writes the layers
+it reads or writes, so that it computes the same as if executed in order.
+
+Optionally the output of every simulation is kept in a
+worldengine.cache.StageCache and reused by later runs, under a key covering
+its seed, its options and everything upstream of it. Every simulation is
+measured (see worldengine.profiling), in the process running it.
+"""
+
+import copy
+
+import numpy
+
+from worldengine.profiling import Measurement, is_tracing, start_tracing
+
+# import global logger
+import worldengine.logger as logger
+
+
+def stage_dependencies(simulations):
+    """
+    :param simulations: simulation classes in their sequential order
+    :return: a list holding, for every simulation, the set of indices of
+             the earlier simulations it depends on
+    """
+    dependencies = []
+    for j, later in enumerate(simulations):
+        reads, writes = set(later.reads), set(later.writes)
+        deps = set()
+        for i in range(j):
+            earlier = simulations[i]
+            if writes & set(earlier.writes) or writes & set(earlier.reads) \
+                    or reads & set(earlier.writes):
+                deps.add(i)
+        dependencies.append(deps)
+    return dependencies
+
+
+def deferrable(simulations):
+    """
+    :return: the set of indices of the lazy simulations whose execution can
+             be deferred until their layers are needed
+    """
+    result = set()
+    for i, simulation in enumerate(simulations):
+        if not getattr(simulation, 'lazy', False):
+            continue
+        touched = set(simulation.reads) | set(simulation.writes)
+        if not any(touched & set(later.writes) for later in simulations[i + 1:]):
+            result.add(i)
+    return result
+
+
+def _same_rng_state(a, b):
+    return all(numpy.array_equal(x, y) for x, y in zip(a, b))
+
+
+def _execute(simulation, world, seed, options=None):
+    """
+    :param options: the keyword arguments of the constructor of the simulation
+    :return: the entry of a simulation: the value it returned, the layers it
+             wrote and the state of the global RNG if it has been used; and
+             the measurement of its execution
+    """
+    rng_state = numpy.random.get_state()
+    with Measurement(simulation.__name__) as measurement:
+        result = simulation(**(options or {})).execute(world, seed)
+    layers = dict((name, world.layers[name]) for name in simulation.writes)
+    measurement.add_layers(layers)
+    new_state = numpy.random.get_state()
+    if _same_rng_state(rng_state, new_state):
+        new_state = None
+    return (result, layers, new_state), measurement
+
+
+def _execute_detached(simulation, world, seed, options, rng_state, trace_memory):
+    """Runs in a worker process: world only holds the layers read by the simulation."""
+    if not hasattr(logger, 'logger'):  # not inherited from the parent process
+        logger.init()
+    if trace_memory:
+        start_tracing()
+    numpy.random.set_state(rng_state)
+    return _execute(simulation, world, seed, options)
+
+
+def _detached_world(world, simulation):
+    detached = copy.copy(world)
+    detached.layers = dict((name, world.layers[name]) for name in simulation.reads
+                           if name in world.layers)
+    return detached
+
+
+def run_stages(world, simulations, seed_dict, jobs=1, executor='process',
+               cache=None, cache_key=None, report=None, options=None):
+    """
+    Execute the simulations on the world.
+    :param simulations: simulation classes in their sequential order
+    :param seed_dict: the seed of every simulation, by class name
+    :param jobs: the number of simulations that may run at the same time,
+                 with 1 they simply run one after the other, as they do
+                 without concurrent.futures (Python 2 without the futures
+                 backport)
+    :param executor: 'process' or 'thread', the kind of pool used when
+                     jobs > 1
+    :param cache: an optional worldengine.cache.StageCache; simulations
+                  found in it are not executed
+    :param cache_key: key describing the world the simulations start from,
+                      required when a cache is given
+    :param report: an optional worldengine.profiling.GenerationReport
+                   receiving the measurement of every simulation
+    :param options: the keyword arguments of the constructor of every
+                    simulation, by class name; simulations left out are
+                    built with their defaults
+    :return: a dictionary holding the value returned by every simulation,
+             by class name
+    """
+    if jobs < 1:
+        raise ValueError("jobs should be at least 1, found %i" % jobs)
+    if executor not in ('process', 'thread'):
+        raise ValueError("Unknown executor '%s'" % executor)
+    if cache is not None and cache_key is None:
+        raise ValueError("A cache_key is required to use the cache")
+
+    if jobs > 1:
+        try:
+            import concurrent.futures
+        except ImportError:
+            logger.logger.debug('concurrent.futures not available, running the stages one at a time')
+            jobs = 1
+
+    if options is None:
+        options = {}
+    dependencies = stage_dependencies(simulations)
+    lazy = deferrable(simulations)
+    results = {}
+
+    # the key of a stage covers its own seed and options and the keys of all
+    # the stages it depends on, hence everything upstream of it
+    keys = []
+    if cache is not None:
+        for i, simulation in enumerate(simulations):
+            name = simulation.__name__
+            keys.append(cache.key(cache_key, name, seed_dict[name], options.get(name, {}),
+                                  [keys[d] for d in sorted(dependencies[i])]))
+
+    def _cached(i):
+        if cache is None:
+            return None
+        with Measurement(simulations[i].__name__) as measurement:
+            entry = cache.load(keys[i])
+        if entry is None:
+            return None
+        measurement.cached = True
+        measurement.add_layers(entry[1])
+        return entry, measurement
+
+    def _finish(i, entry, measurement):
+        name = simulations[i].__name__
+        result, layers, rng_state = entry
+        world.layers.update(layers)
+        if rng_state is not None:
+            numpy.random.set_state(rng_state)
+        results[name] = result
+        if report is not None:
+            report.add(measurement)
+        if measurement.cached:
+            logger.logger.debug('...%s loaded from cache' % name)
+        else:
+            if cache is not None:
+                cache.store(keys[i], entry)
+            logger.logger.debug('...%s done. Elapsed time %f seconds.'
+                                % (name, measurement.wall_time))
+
+    def _defer(i):
+        simulation = simulations[i]
+
+        def _produce():
+            cached = _cached(i)
+            if cached is not None:
+                _finish(i, *cached)
+            else:
+                _finish(i, *_execute(simulation, world, seed_dict[simulation.__name__],
+                                     options.get(simulation.__name__)))
+        world.layers.add_lazy(simulation.writes, _produce)
+        logger.logger.debug('...%s deferred until its layers are needed' % simulation.__name__)
+
+    if jobs == 1:
+        for i, simulation in enumerate(simulations):
+            if i in lazy:
+                _defer(i)
+                continue
+            cached = _cached(i)
+            if cached is not None:
+                _finish(i, *cached)
+            else:
+                _finish(i, *_execute(simulation, world, seed_dict[simulation.__name__],
+                                     options.get(simulation.__name__)))
+        return results
+
+    pending = set(range(len(simulations)))
+    done = set()
+    running = {}
+
+    if executor == 'process':
+        pool = concurrent.futures.ProcessPoolExecutor(max_workers=jobs)
+    else:
+        pool = concurrent.futures.ThreadPoolExecutor(max_workers=jobs)
+
+    with pool:
+        while pending or running:
+            submitted = True
+            while submitted:  # stages loaded from the cache may unblock others
+                submitted = False
+                for i in sorted(pending):
+                    if not dependencies[i] <= done:
+                        continue
+                    pending.remove(i)
+                    submitted = True
+                    if i in lazy:
+                        _defer(i)
+                        done.add(i)
+                        continue
+                    cached = _cached(i)
+                    if cached is not None:
+                        _finish(i, *cached)
+                        done.add(i)
+                        continue
+                    simulation = simulations[i]
+                    seed = seed_dict[simulation.__name__]
+                    stage_options = options.get(simulation.__name__)
+                    if executor == 'process':
+                        future = pool.submit(_execute_detached, simulation,
+                                             _detached_world(world, simulation),
+                                             seed, stage_options, numpy.random.get_state(),
+                                             is_tracing())
+                    else:
+                        future = pool.submit(_execute, simulation, world, seed, stage_options)
+                    running[future] = i
+            if not running:
+                continue
+
+            finished, _ = concurrent.futures.wait(
+                running, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in finished:
+                i = running.pop(future)
+                try:
+                    entry, measurement = future.result()
+                except Exception:
+                    for other in running:
+                        other.cancel()
+                    raise
+                _finish(i, entry, measurement)
+                done.add(i)
+
+    return results
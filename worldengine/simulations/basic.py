@@ -1,3 +1,5 @@
+import math
+
 import numpy
 
 
@@ -44,7 +46,60 @@ def find_threshold(map_data, land_percentage, ocean=None):#never used anywhere?
     return search(0, 255, desired_land)
 
 
+def find_thresholds(map_data, fractions, mask=None):
+    """
+    Exact counterpart of find_threshold_f for several fractions at once: the
+    values are sorted a single time and every threshold is read from them.
+
+    For a fraction f of the n values not masked, the threshold is the one
+    find_threshold_f converges to: among the thresholds leaving f * n values
+    or less strictly above them, take the smallest one; use it unless the
+    value just below it (the previous value, or the float right below the
+    lowest value) leaves a number of values above it closer to f * n.
+    :param fractions: the fractions of values to be above each threshold
+    :param mask: optional boolean array, True where values are to be ignored
+    :return: the list of the thresholds, in the order of fractions
+    """
+    height, width = map_data.shape
+    if mask is not None:
+        if mask.shape != map_data.shape:
+            raise Exception(
+                "Dimension of map_data and mask do not match. " +
+                "Map is %d x %d, while mask is %d x%d" % (
+                    width, height, mask.shape[1], mask.shape[0]))
+        values = numpy.sort(map_data[numpy.logical_not(mask)], axis=None)
+    else:
+        values = numpy.sort(map_data, axis=None)
+
+    n = values.size
+    thresholds = []
+    for fraction in fractions:
+        if n == 0:  # any threshold leaves nothing above it
+            thresholds.append(-numpy.inf)
+            continue
+        desired = min(max(n * fraction, 0.0), float(n))
+        i = int(math.ceil(n - 1 - desired))
+        if i < 0:  # everything is to be above
+            thresholds.append(float(numpy.nextafter(values[0], -numpy.inf)))
+            continue
+        threshold = values[i]
+        first = numpy.searchsorted(values, threshold, side='left')
+        last = numpy.searchsorted(values, threshold, side='right')
+        above, above_below = n - last, n - first  # above threshold, above the value below it
+        if above_below - desired < desired - above:
+            if first > 0:
+                threshold = values[first - 1]
+            else:
+                threshold = numpy.nextafter(values[0], -numpy.inf)
+        thresholds.append(float(threshold))
+    return thresholds
+
+
 def find_threshold_f(map_data, land_perc, ocean=None, max=1000.0, mindist=0.005):
+    """
+    Bisection search of the threshold leaving land_perc of the values above
+    it, to within mindist. Superseded by find_thresholds, which is exact.
+    """
     height, width = map_data.shape
     
     #maybe map was already masked when we got it; if not, this will make sure we operate on a mask
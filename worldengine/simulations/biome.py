@@ -1,8 +1,79 @@
 import numpy
 
+from worldengine.biome import BARE_ROCK, biome_index_to_name, biome_name_to_index
+
+
+# The biomes of the land, by temperature band (polar, alpine, boreal, cool,
+# warm, subtropical, tropical) and then by moisture band (superarid,
+# perarid, arid, semiarid, subhumid, humid, perhumid, superhumid): the last
+# biome of a row is the one of all the wetter bands.
+_BIOMES_BY_TEMPERATURE = [
+    ['polar desert', 'ice'],
+    ['subpolar dry tundra', 'subpolar moist tundra', 'subpolar wet tundra',
+     'subpolar rain tundra'],
+    ['boreal desert', 'boreal dry scrub', 'boreal moist forest', 'boreal wet forest',
+     'boreal rain forest'],
+    ['cool temperate desert', 'cool temperate desert scrub', 'cool temperate steppe',
+     'cool temperate moist forest', 'cool temperate wet forest',
+     'cool temperate rain forest'],
+    ['warm temperate desert', 'warm temperate desert scrub', 'warm temperate thorn scrub',
+     'warm temperate dry forest', 'warm temperate moist forest',
+     'warm temperate wet forest', 'warm temperate rain forest'],
+    ['subtropical desert', 'subtropical desert scrub', 'subtropical thorn woodland',
+     'subtropical dry forest', 'subtropical moist forest', 'subtropical wet forest',
+     'subtropical rain forest'],
+    ['tropical desert', 'tropical desert scrub', 'tropical thorn woodland',
+     'tropical very dry forest', 'tropical dry forest', 'tropical moist forest',
+     'tropical wet forest', 'tropical rain forest'],
+]
+
+_MOISTURE_QUANTILES = ['87', '75', '62', '50', '37', '25', '12']
+
+
+def _lookup_table():
+    """
+    :return: the table of the indices of the biomes (see
+             worldengine.biome.biome_name_to_index) by temperature band and
+             moisture band (see _bands). Cells in no temperature band are
+             bare rock.
+    """
+    n_moisture = len(_MOISTURE_QUANTILES) + 1
+    table = numpy.full((len(_BIOMES_BY_TEMPERATURE) + 1, n_moisture + 1), BARE_ROCK,
+                       dtype=numpy.uint8)
+    for t, row in enumerate(_BIOMES_BY_TEMPERATURE):
+        for m in range(n_moisture + 1):
+            table[t, m] = biome_name_to_index(row[min(m, len(row) - 1)])
+    return table
+
+
+def _bands(values, thresholds):
+    """
+    :return: for every value, the first i such that
+             thresholds[i - 1] <= value < thresholds[i], the band below the
+             first threshold being 0 and the one above the last threshold
+             len(thresholds); len(thresholds) + 1 for the values in none of
+             them (NaN, or between thresholds which are out of order)
+    """
+    thresholds = numpy.asarray(thresholds, dtype=float)
+    n = len(thresholds)
+    if numpy.all(thresholds[1:] >= thresholds[:-1]):
+        bands = numpy.digitize(values, thresholds)
+        bands[numpy.isnan(values)] = n + 1
+        return bands
+    # ranges out of order (the command line only warns about them): the
+    # bands overlap, keep the first one matching
+    bounds = numpy.concatenate([[-numpy.inf], thresholds, [numpy.inf]])
+    bands = numpy.full(values.shape, n + 1, dtype=numpy.intp)
+    for i in reversed(range(n + 1)):
+        bands[(bounds[i] <= values) & (values < bounds[i + 1])] = i
+    return bands
+
 
 class BiomeSimulation(object):
 
+    reads = ('temperature', 'moisture', 'ocean')
+    writes = ('biome',)
+
     @staticmethod
     def is_applicable(world):
         return {'moisture', 'temperature'} <= set(world.layers.keys()) and not 'biome' in world.layers
@@ -11,107 +82,19 @@ class BiomeSimulation(object):
     def execute(world, seed):
         assert BiomeSimulation.is_applicable(world)
         assert seed is not None
-        w = world
-        width = world.size.width
-        height = world.size.height
+        temperature = world.layers['temperature']
+        moisture = world.layers['moisture']
         ocean = world.layers['ocean'].data
-        cm = {}
-        biome_cm = {}
-        biome = numpy.zeros((height, width), dtype = object)#this is still kind of expensive memory-wise
-        for y in range(height):
-            for x in range(width):
-                if ocean[y, x]:
-                    biome[y, x] = 'ocean'
-                else:
-                    if w.is_temperature_polar((x, y)):
-                        if w.is_moisture_superarid((x, y)):
-                            biome[y, x] = 'polar desert'
-                        else:
-                            biome[y, x] = 'ice'
-                    elif w.is_temperature_alpine((x, y)):
-                        if w.is_moisture_superarid((x, y)):
-                            biome[y, x] = 'subpolar dry tundra'
-                        elif w.is_moisture_perarid((x, y)):
-                            biome[y, x] = 'subpolar moist tundra'
-                        elif w.is_moisture_arid((x, y)):
-                            biome[y, x] = 'subpolar wet tundra'
-                        else:
-                            biome[y, x] = 'subpolar rain tundra'
-                    elif w.is_temperature_boreal((x, y)):
-                        if w.is_moisture_superarid((x, y)):
-                            biome[y, x] = 'boreal desert'
-                        elif w.is_moisture_perarid((x, y)):
-                            biome[y, x] = 'boreal dry scrub'
-                        elif w.is_moisture_arid((x, y)):
-                            biome[y, x] = 'boreal moist forest'
-                        elif w.is_moisture_semiarid((x, y)):
-                            biome[y, x] = 'boreal wet forest'
-                        else:
-                            biome[y, x] = 'boreal rain forest'
-                    elif w.is_temperature_cool((x, y)):
-                        if w.is_moisture_superarid((x, y)):
-                            biome[y, x] = 'cool temperate desert'
-                        elif w.is_moisture_perarid((x, y)):
-                            biome[y, x] = 'cool temperate desert scrub'
-                        elif w.is_moisture_arid((x, y)):
-                            biome[y, x] = 'cool temperate steppe'
-                        elif w.is_moisture_semiarid((x, y)):
-                            biome[y, x] = 'cool temperate moist forest'
-                        elif w.is_moisture_subhumid((x, y)):
-                            biome[y, x] = 'cool temperate wet forest'
-                        else:
-                            biome[y, x] = 'cool temperate rain forest'
-                    elif w.is_temperature_warm((x, y)):
-                        if w.is_moisture_superarid((x, y)):
-                            biome[y, x] = 'warm temperate desert'
-                        elif w.is_moisture_perarid((x, y)):
-                            biome[y, x] = 'warm temperate desert scrub'
-                        elif w.is_moisture_arid((x, y)):
-                            biome[y, x] = 'warm temperate thorn scrub'
-                        elif w.is_moisture_semiarid((x, y)):
-                            biome[y, x] = 'warm temperate dry forest'
-                        elif w.is_moisture_subhumid((x, y)):
-                            biome[y, x] = 'warm temperate moist forest'
-                        elif w.is_moisture_humid((x, y)):
-                            biome[y, x] = 'warm temperate wet forest'
-                        else:
-                            biome[y, x] = 'warm temperate rain forest'
-                    elif w.is_temperature_subtropical((x, y)):
-                        if w.is_moisture_superarid((x, y)):
-                            biome[y, x] = 'subtropical desert'
-                        elif w.is_moisture_perarid((x, y)):
-                            biome[y, x] = 'subtropical desert scrub'
-                        elif w.is_moisture_arid((x, y)):
-                            biome[y, x] = 'subtropical thorn woodland'
-                        elif w.is_moisture_semiarid((x, y)):
-                            biome[y, x] = 'subtropical dry forest'
-                        elif w.is_moisture_subhumid((x, y)):
-                            biome[y, x] = 'subtropical moist forest'
-                        elif w.is_moisture_humid((x, y)):
-                            biome[y, x] = 'subtropical wet forest'
-                        else:
-                            biome[y, x] = 'subtropical rain forest'
-                    elif w.is_temperature_tropical((x, y)):
-                        if w.is_moisture_superarid((x, y)):
-                            biome[y, x] = 'tropical desert'
-                        elif w.is_moisture_perarid((x, y)):
-                            biome[y, x] = 'tropical desert scrub'
-                        elif w.is_moisture_arid((x, y)):
-                            biome[y, x] = 'tropical thorn woodland'
-                        elif w.is_moisture_semiarid((x, y)):
-                            biome[y, x] = 'tropical very dry forest'
-                        elif w.is_moisture_subhumid((x, y)):
-                            biome[y, x] = 'tropical dry forest'
-                        elif w.is_moisture_humid((x, y)):
-                            biome[y, x] = 'tropical moist forest'
-                        elif w.is_moisture_perhumid((x, y)):
-                            biome[y, x] = 'tropical wet forest'
-                        else:
-                            biome[y, x] = 'tropical rain forest'
-                    else:
-                        biome[y, x] = 'bare rock'
-                if not biome[y, x] in biome_cm:
-                    biome_cm[biome[y, x]] = 0
-                biome_cm[biome[y, x]] += 1
-        w.biome = biome
-        return cm, biome_cm
+
+        temperature_bands = _bands(temperature.data,
+                                   [th for _, th in temperature.thresholds[:-1]])
+        moisture_bands = _bands(moisture.data,
+                                [moisture.quantiles[q] for q in _MOISTURE_QUANTILES])
+        biome = _lookup_table()[temperature_bands, moisture_bands]
+        biome[ocean] = biome_name_to_index('ocean')
+
+        counts = numpy.bincount(biome.ravel(), minlength=BARE_ROCK + 1)
+        biome_cm = dict((biome_index_to_name(i) if i != BARE_ROCK else 'bare rock', int(c))
+                        for i, c in enumerate(counts) if c > 0)
+        world.biome = biome
+        return {}, biome_cm
@@ -1,6 +1,6 @@
-import math
 import numpy
 import worldengine.astar
+from worldengine.common import in_values
 
 # Direction
 NORTH = [0, -1]
@@ -28,7 +28,75 @@ def in_circle(radius, center_x, center_y, x, y):
     return square_dist <= radius ** 2
 
 
+def _border(dx, dy):
+    """:return: the index of the cells whose neighbour dx, dy is across the border"""
+    return (0 if dy < 0 else -1 if dy > 0 else slice(None),
+            0 if dx < 0 else -1 if dx > 0 else slice(None))
+
+
+def _rings(max_radius):
+    """
+    :return: for every radius from 1 to max_radius, the arrays of the x and
+             y offsets of the cells within the circle of that radius but not
+             within the previous one, by x and then by y
+    """
+    rings = []
+    for radius in range(1, max_radius + 1):
+        offsets = [(dx, dy) for dx in range(-radius, radius + 1)
+                   for dy in range(-radius, radius + 1)
+                   if in_circle(radius, 0, 0, dx, dy) and not in_circle(radius - 1, 0, 0, dx, dy)]
+        rings.append(tuple(numpy.array(offsets).T))
+    return rings
+
+
+# the rings findLowerElevation looks at, from the nearest
+_RINGS = _rings(40)
+
+# the cells river_erosion brings closer to a river cell: the x and y offsets
+# (in the square from -2 to 1) within 2 of it, and how much closer, by
+# Chebyshev distance (0.2 for the nearest ones, 0.05 for the others)
+_VALLEY = tuple(numpy.array(c) for c in zip(*[
+    (dx, dy, 0.2 if max(abs(dx), abs(dy)) == 1 else 0.05)
+    for dx in range(-2, 2) for dy in range(-2, 2)
+    if (dx, dy) != (0, 0) and in_circle(2, 0, 0, dx, dy)]))
+
+
+class Rivers(list):
+    """
+    The rivers found so far, lists of [x, y], with an index of the cells
+    they go through: for every cell of the map the first river going
+    through it (-1 if none) and the position of the cell in that river,
+    and for every river the arrays of its x and y.
+    """
+
+    def __init__(self, width, height):
+        list.__init__(self)
+        self.river = numpy.full((height, width), -1, dtype=numpy.int32)
+        self.position = numpy.full((height, width), -1, dtype=numpy.int32)
+        self.cells = []
+
+    def append(self, river):
+        xs, ys = numpy.array(river, dtype=numpy.intp).reshape(-1, 2).T
+        # the first position of every cell, for the ones in no river yet
+        _, first = numpy.unique(ys * self.river.shape[1] + xs, return_index=True)
+        first = first[self.river[ys[first], xs[first]] == -1]
+        self.river[ys[first], xs[first]] = len(self)
+        self.position[ys[first], xs[first]] = first
+        self.cells.append((xs, ys))
+        list.append(self, river)
+
+    def tail(self, x, y):
+        """:return: the first river going through x, y, from there on; None if none does"""
+        river = self.river[y, x]
+        if river == -1:
+            return None
+        return [list(cell) for cell in self[river][self.position[y, x]:]]
+
+
 class ErosionSimulation(object):
+    reads = ('precipitation', 'elevation', 'ocean')
+    writes = ('elevation', 'river_map', 'lake_map')
+
     def __init__(self):
         self.wrap = True
 
@@ -40,7 +108,7 @@ class ErosionSimulation(object):
 
         water_flow = numpy.zeros((world.size.height, world.size.width))
         water_path = numpy.zeros((world.size.height, world.size.width), dtype=int)
-        river_list = []
+        river_list = Rivers(world.size.width, world.size.height)
         lake_list = []
         river_map = numpy.zeros((world.size.height, world.size.width))
         lake_map = numpy.zeros((world.size.height, world.size.width))
@@ -56,15 +124,15 @@ class ErosionSimulation(object):
             river = self.river_flow(source, world, river_list, lake_list)
             if len(river) > 0:
                 river_list.append(river)
-                self.cleanUpFlow(river, world)
+                self.cleanUpFlow(river_list.cells[-1], world)
                 rx, ry = river[-1]  # find last cell in river
                 if not world.is_ocean((rx, ry)):
                     lake_list.append(river[-1])  # river flowed into a lake
 
         # step four: simulate erosion and updating river map
-        for river in river_list:
-            self.river_erosion(river, world)
-            self.rivermap_update(river, water_flow, river_map, world.layers['precipitation'].data)
+        for cells in river_list.cells:
+            self.river_erosion(cells, world)
+            self.rivermap_update(cells, water_flow, river_map, world.layers['precipitation'].data)
 
         # step five: rivers with no paths to sea form lakes
         for lake in lake_list:
@@ -76,21 +144,26 @@ class ErosionSimulation(object):
         world.lakemap = lake_map
 
     def find_water_flow(self, world, water_path):
-        """Find the flow direction for each cell in heightmap"""
-
-        # iterate through each cell
-        for x in range(world.size.width - 1):
-            for y in range(world.size.height - 1):
-                # search around cell for a direction
-                path = self.find_quick_path([x, y], world)
-                if path:
-                    tx, ty = path
-                    flow_dir = [tx - x, ty - y]
-                    key = 0
-                    for direction in DIR_NEIGHBORS_CENTER:
-                        if direction == flow_dir:
-                            water_path[y, x] = key
-                        key += 1
+        """
+        Find the flow direction for each cell in heightmap: the index in
+        DIR_NEIGHBORS_CENTER of its lowest neighbour, as find_quick_path
+        finds it, 0 if no neighbour is lower or if the lowest one is across
+        the border of the map.
+        """
+        elevation = world.layers['elevation'].data
+        around = [elevation]
+        for dx, dy in DIR_NEIGHBORS:
+            # along a single axis, numpy < 1.12 cannot roll along several
+            neighbours = numpy.roll(elevation, -dy, axis=0) if dy else numpy.roll(elevation, -dx, axis=1)
+            if not self.wrap:  # the cells across the border are not neighbours
+                neighbours[_border(dx, dy)] = numpy.inf
+            around.append(neighbours)
+        # the first lowest: the cell itself unless a neighbour is strictly
+        # lower, the first of the lowest neighbours otherwise
+        water_path[:] = numpy.argmin(numpy.array(around), axis=0)
+        for key, (dx, dy) in enumerate(DIR_NEIGHBORS, 1):
+            border = water_path[_border(dx, dy)]
+            border[border == key] = 0
 
     def find_quick_path(self, river, world):
         # Water flows based on cost, seeking the highest elevation difference
@@ -133,53 +206,63 @@ class ErosionSimulation(object):
         #     flowing rainfall along paths until a 'flow' threshold is reached
         #     and we have a beginning of a river... trickle->stream->river->sea
 
-        # step one: Using flow direction, follow the path for each cell
-        #     adding the previous cell's flow to the current cell's flow.
-        # step two: We loop through the water flow map looking for cells
-        #     above the water flow threshold. These are our river sources and
-        #     we mark them as rivers. While looking, the cells with no
-        #     out-going flow, above water flow threshold and are still
-        #     above sea level are marked as 'sources'.
-        for y in range(0, world.size.height - 1):
-            for x in range(0, world.size.width - 1):
-                rain_fall = world.layers['precipitation'].data[y, x]
-                water_flow[y, x] = rain_fall
-
-                if water_path[y, x] == 0:
-                    continue  # ignore cells without flow direction
-                cx, cy = x, y  # begin with starting location
-                neighbour_seed_found = False
-                # follow flow path to where it may lead
-                while not neighbour_seed_found:
-
-                    # have we found a seed?
-                    if world.is_mountain((cx, cy)) and water_flow[cy, cx] >= RIVER_TH:
-
-                        # try not to create seeds around other seeds
-                        for seed in river_source_list:
-                            sx, sy = seed
-                            if in_circle(9, cx, cy, sx, sy):
-                                neighbour_seed_found = True
-                        if neighbour_seed_found:
-                            break  # we do not want seeds for neighbors
-
-                        river_source_list.append([cx, cy])  # river seed
-                        break
-
-                    # no path means dead end...
-                    if water_path[cy, cx] == 0:
-                        break  # break out of loop
-
-                    # follow path, add water flow from previous cell
-                    dx, dy = DIR_NEIGHBORS_CENTER[water_path[cy, cx]]
-                    nx, ny = cx + dx, cy + dy  # calculate next cell
-                    water_flow[ny, nx] += rain_fall
-                    cx, cy = nx, ny  # set current cell to next cell
+        # step one: Using flow direction, add the flow of every cell to the
+        #     cell it flows to. A cell is done once all the cells flowing to
+        #     it are: the cells are processed from upstream to downstream,
+        #     all the cells whose upstream cells are done at once.
+        # step two: The cells on mountains with a water flow above the
+        #     threshold stop the paths flowing down to them. A path starts at
+        #     every cell with a flow direction, the cell reached first (the
+        #     paths being followed in the order of the cells they start
+        #     from) where a path stops is a river source, unless there is
+        #     already a source around it.
+        height, width = water_path.shape
+        mountain = numpy.logical_and(
+            numpy.logical_not(world.layers['ocean'].data),
+            world.layers['elevation'].data > world.get_mountain_level()).ravel()
+        water_flow[:] = world.layers['precipitation'].data
+        flow = water_flow.reshape(-1)
+
+        directions = numpy.array(DIR_NEIGHBORS_CENTER)[water_path]
+        ys, xs = numpy.indices((height, width))
+        downstream = ((ys + directions[:, :, 1]) * width + xs + directions[:, :, 0]).ravel()
+        flowing = water_path.ravel() != 0
+        # the first cell, in raster order, whose path reaches each cell
+        first = numpy.where(flowing, numpy.arange(height * width), height * width)
+        stops = numpy.zeros(height * width, dtype=bool)
+
+        pending = numpy.bincount(downstream[flowing], minlength=height * width)  # upstream cells not done
+        level = numpy.flatnonzero(pending == 0)
+        while level.size:
+            stops[level] = numpy.logical_and(mountain[level], flow[level] >= RIVER_TH)
+            level = level[flowing[level]]
+            to = downstream[level]
+            numpy.add.at(flow, to, flow[level])
+            passing = numpy.logical_not(stops[level])
+            numpy.minimum.at(first, to[passing], first[level[passing]])
+            numpy.subtract.at(pending, to, 1)
+            level = numpy.unique(to[pending[to] == 0])
+
+        # try not to create seeds around other seeds: the cells around a
+        # seed are marked as they are found
+        around = numpy.array([(dx, dy) for dx in range(-9, 10) for dy in range(-9, 10)
+                              if in_circle(9, 0, 0, dx, dy)])
+        taken = numpy.zeros((height, width), dtype=bool)
+        candidates = numpy.flatnonzero(numpy.logical_and(stops, first < height * width))
+        for candidate in candidates[numpy.argsort(first[candidates], kind='mergesort')]:
+            cy, cx = divmod(int(candidate), width)
+            if taken[cy, cx]:
+                continue  # we do not want seeds for neighbors
+            river_source_list.append([cx, cy])  # river seed
+            tx, ty = cx + around[:, 0], cy + around[:, 1]
+            inside = (tx >= 0) & (tx < width) & (ty >= 0) & (ty < height)
+            taken[ty[inside], tx[inside]] = True
         return river_source_list
 
     def river_flow(self, source, world, river_list, lake_list):
         """simulate fluid dynamics by using starting point and flowing to the
-        lowest available point"""
+        lowest available point; river_list holds the rivers found so far
+        (see Rivers)"""
         current_location = source
         path = [source]
 
@@ -194,16 +277,11 @@ class ErosionSimulation(object):
                     ax, ay = overflow(ax, world.size.width), overflow(ay,
                                                                  world.size.height)
 
-                for river in river_list:
-                    if [ax, ay] in river:
-                        merge = False
-                        for rx, ry in river:
-                            if [ax, ay] == [rx, ry]:
-                                merge = True
-                                path.append([rx, ry])
-                            elif merge:
-                                path.append([rx, ry])
-                        return path  # skip the rest, return path
+                if not world.contains((ax, ay)):
+                    continue
+                tail = river_list.tail(ax, ay)
+                if tail is not None:
+                    return path + tail  # skip the rest, return path
 
             # found a sea?
             if world.is_ocean((x, y)):
@@ -290,118 +368,88 @@ class ErosionSimulation(object):
 
     def cleanUpFlow(self, river, world):
         '''Validate that for each point in river is equal to or lower than the
-        last'''
-        celevation = 1.0
-        for r in river:
-            rx, ry = r
-            relevation = world.layers['elevation'].data[ry, rx]
-            if relevation <= celevation:
-                celevation = relevation
-            elif relevation > celevation:
-                world.layers['elevation'].data[ry, rx] = celevation
+        last: river is the x and y of its cells (see Rivers.cells), each point
+        is lowered to the lowest one before it, and 1.0 at most'''
+        xs, ys = river
+        elevation = world.layers['elevation'].data
+        elevation[ys, xs] = numpy.minimum.accumulate(numpy.minimum(elevation[ys, xs], 1.0))
         return river
 
     def findLowerElevation(self, source, world):
         '''Try to find a lower elevation with in a range of an increasing
-        circle's radius and try to find the best path and return it'''
+        circle's radius and try to find the best path and return it: the
+        lowest cell within the first radius where there is a lower one, the
+        first one in the order of _RINGS if there are several'''
         x, y = source
-        currentRadius = 1
-        maxRadius = 40
-        lowestElevation = world.layers['elevation'].data[y, x]
-        destination = []
-        notFound = True
-        isWrapped = False
-        wrapped = []
-
-        while notFound and currentRadius <= maxRadius:
-            for cx in range(-currentRadius, currentRadius + 1):
-                for cy in range(-currentRadius, currentRadius + 1):
-                    rx, ry = x + cx, y + cy
-
-                    # are we within bounds?
-                    if not self.wrap and not world.contains((rx, ry)):
-                        continue
-
-                    # are we within a circle?
-                    if not in_circle(currentRadius, x, y, rx, ry):
-                        continue
-
-                    rx, ry = overflow(rx, world.size.width), overflow(ry,
-                                                                 world.size.height)
-
-                    # if utilities.outOfBounds([x+cx, y+cy], self.size):
-                    #                        print "Fixed:",x ,y,  rx, ry
-
-                    elevation = world.layers['elevation'].data[ry, rx]
-                    # have we found a lower elevation?
-                    if elevation < lowestElevation:
-                        lowestElevation = elevation
-                        destination = [rx, ry]
-                        notFound = False
-                        if not world.contains((x + cx, y + cy)):
-                            wrapped.append(destination)
-
-            currentRadius += 1
-
-        if destination in wrapped:
-            isWrapped = True
-        # print "Wrapped lower elevation found:", rx, ry, "!"
-        return isWrapped, destination
+        elevation = world.layers['elevation'].data
+        width, height = world.size.width, world.size.height
+        lowestElevation = elevation[y, x]
+
+        for dx, dy in _RINGS:
+            rx, ry = x + dx, y + dy
+            inside = (rx >= 0) & (rx < width) & (ry >= 0) & (ry < height)
+            if not self.wrap:  # are we within bounds?
+                rx, ry, inside = rx[inside], ry[inside], inside[inside]
+            rx, ry = overflow(rx, width), overflow(ry, height)
+            ring = elevation[ry, rx]
+            # have we found a lower elevation?
+            if ring.size and ring.min() < lowestElevation:
+                i = numpy.argmin(ring)
+                return not inside[i], [int(rx[i]), int(ry[i])]
+        return False, []
 
     def river_erosion(self, river, world):
         """ Simulate erosion in heightmap based on river path.
             * current location must be equal to or less than previous location
             * riverbed is carved out by % of volume/flow
             * sides of river are also eroded to slope into riverbed.
+        The cells around every cell of the river (see _VALLEY) higher than it
+        are brought closer to it, in the order of the river.
         """
-
-        # erosion around river, create river valley
-        for r in river:
-            rx, ry = r
-            radius = 2
-            for x in range(rx - radius, rx + radius):
-                for y in range(ry - radius, ry + radius):
-                    if not self.wrap and not world.contains(
-                            (x, y)):  # ignore edges of map
-                        continue
-                    x, y = overflow(x, world.size.width), overflow(y, world.size.height)
-                    curve = 1.0
-                    if [x, y] == [0, 0]:  # ignore center
-                        continue
-                    if [x, y] in river:  # ignore river itself
-                        continue
-                    if world.layers['elevation'].data[y, x] <= world.layers['elevation'].data[ry, rx]:
-                        # ignore areas lower than river itself
-                        continue
-                    if not in_circle(radius, rx, ry, x,
-                                     y):  # ignore things outside a circle
-                        continue
-
-                    adx, ady = math.fabs(rx - x), math.fabs(ry - y)
-                    if adx == 1 or ady == 1:
-                        curve = 0.2
-                    elif adx == 2 or ady == 2:
-                        curve = 0.05
-
-                    diff = world.layers['elevation'].data[ry, rx] - world.layers['elevation'].data[y, x]
-                    newElevation = world.layers['elevation'].data[y, x] + (
-                        diff * curve)
-                    if newElevation <= world.layers['elevation'].data[ry, rx]:
-                        logger.logger.error('newElevation is <= than river, fix me...')
-                        newElevation = world.layers['elevation'].data[r, x]
-                    world.layers['elevation'].data[y, x] = newElevation
-        return
+        xs, ys = river
+        elevation = world.layers['elevation'].data
+        height, width = elevation.shape
+        dx, dy, curves = _VALLEY
+
+        # erosion around river, create river valley: every cell around every
+        # cell of the river, the river cell it is eroded towards and its place
+        # in the river
+        x = (xs + dx[:, numpy.newaxis]).ravel()
+        y = (ys + dy[:, numpy.newaxis]).ravel()
+        bed_x, bed_y = numpy.tile(xs, len(dx)), numpy.tile(ys, len(dy))
+        place = numpy.tile(numpy.arange(len(xs)), len(dx))
+        curve = numpy.repeat(curves, len(xs))
+
+        # ignore edges of map (wrapped, they used to be out of the circle),
+        # the river itself and, as always, the cell at 0, 0 of the map
+        keep = (x >= 0) & (x < width) & (y >= 0) & (y < height) & ((x != 0) | (y != 0))
+        keep[keep] = numpy.logical_not(in_values(y[keep] * width + x[keep], ys * width + xs))
+        cells = y[keep] * width + x[keep]
+        # the erosions of every cell, in the order of the river
+        by_cell = numpy.lexsort((place[keep], cells))
+        cells = cells[by_cell]
+        x, y, bed_x, bed_y, curve = (a[keep][by_cell] for a in (x, y, bed_x, bed_y, curve))
+        if not cells.size:
+            return
+
+        # the cells are eroded independently, all their k-th erosions at once
+        first = numpy.flatnonzero(numpy.concatenate([[True], cells[1:] != cells[:-1]]))
+        counts = numpy.diff(numpy.append(first, cells.size))
+        nth = numpy.arange(cells.size) - numpy.repeat(first, counts)
+        for k in range(counts.max()):
+            i = numpy.flatnonzero(nth == k)
+            bed = elevation[bed_y[i], bed_x[i]]
+            current = elevation[y[i], x[i]]
+            higher = current > bed  # ignore areas lower than river itself
+            i, bed, current = i[higher], bed[higher], current[higher]
+            # never below the river, should rounding bring it there
+            elevation[y[i], x[i]] = numpy.maximum(current + (bed - current) * curve[i], bed)
 
     def rivermap_update(self, river, water_flow, rivermap, precipitations):
         """Update the rivermap with the rainfall that is to become
-        the waterflow"""
-
-        isSeed = True
-        px, py = (0, 0)
-        for x, y in river:
-            if isSeed:
-                rivermap[y, x] = water_flow[y, x]
-                isSeed = False
-            else:
-                rivermap[y, x] = precipitations[y, x] + rivermap[py, px]
-            px, py = x, y
+        the waterflow: the flow of the seed, plus the rainfall of every
+        cell of the river down to each one"""
+        xs, ys = river
+        flow = precipitations[ys, xs]
+        flow[0] = water_flow[ys[0], xs[0]]
+        rivermap[ys, xs] = numpy.cumsum(flow)
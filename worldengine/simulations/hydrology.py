@@ -1,9 +1,37 @@
-from worldengine.simulations.basic import find_threshold_f
+from worldengine.simulations.basic import find_thresholds
 import numpy
 
+# the neighbours of a tile, in the order of World.tiles_around
+_NEIGHBOURS = [(dx, dy) for dx in (-1, 0, 1) for dy in (-1, 0, 1) if dx != 0 or dy != 0]
+
 
 class WatermapSimulation(object):
 
+    reads = ('precipitation', 'elevation', 'ocean')
+    writes = ('watermap',)
+
+    # 'droplet' follows n droplets falling on random land tiles, drawn from
+    # the global RNG, as worldengine always did: a seed always gives the
+    # same watermap. 'flow' pushes the precipitation of every land tile
+    # downhill, all the tiles of a level at once (see _flow), much faster
+    # but a different watermap. 'particles' moves droplets like 'droplet'
+    # does, all of them at once (see _particles), their number growing
+    # with the land.
+    ENGINES = ('droplet', 'flow', 'particles')
+
+    def __init__(self, engine='droplet', n=20000, density=0.25):
+        """
+        :param n: the number of droplets; the flow engine spreads as much
+                  precipitation as they would on average
+        :param density: the number of droplets per land tile of the
+                        particles engine
+        """
+        if engine not in self.ENGINES:
+            raise ValueError("Unknown engine '%s', expected one of %s" % (engine, ', '.join(self.ENGINES)))
+        self.engine = engine
+        self.n = n
+        self.density = density
+
     @staticmethod
     def is_applicable(world):
         return 'precipitation' in world.layers and (not 'watermap' in world.layers)
@@ -11,52 +39,216 @@ class WatermapSimulation(object):
     def execute(self, world, seed):
         assert WatermapSimulation.is_applicable(world)
         assert seed is not None
-        data, thresholds = self._watermap(world, 20000)
+        stats = None
+        if self.engine == 'droplet':
+            data, thresholds = self._watermap(world, self.n)
+        elif self.engine == 'flow':
+            data, thresholds = self._flow(world, self.n)
+        else:
+            data, thresholds, stats = self._particles(world, seed, self.density)
         world.watermap = (data, thresholds)
+        return stats
+
+    @staticmethod
+    def _thresholds(world, data):
+        ocean = world.layers['ocean'].data
+        return dict(zip(['creek', 'river', 'main river'],
+                        find_thresholds(data, [0.05, 0.02, 0.007], ocean)))
+
+    @staticmethod
+    def _droplet_shares(level, around):
+        """
+        :param level: the elevation (plus water) of some tiles
+        :param around: the ones of their neighbours, in the order of
+                       _NEIGHBOURS along the first axis (inf outside the map)
+        :return: the share of the water leaving each tile which flows to
+                 each neighbour, as a droplet does: 4 per unit of elevation
+                 difference (rounded down) with each lower neighbour, at
+                 least 1 for the lowest one (and those which were the
+                 lowest so far when looking at the neighbours in order)
+        """
+        shares = numpy.zeros(around.shape, dtype=numpy.int64)
+        min_lower = numpy.full(level.shape, numpy.inf)
+        for k in range(len(around)):
+            e = around[k]
+            lower = e < level
+            dq = numpy.zeros(level.shape, dtype=numpy.int64)
+            dq[lower] = (level[lower] - e[lower]).astype(numpy.int64) << 2
+            new_min = numpy.logical_and(lower, e < min_lower)
+            dq[numpy.logical_and(new_min, dq == 0)] = 1
+            min_lower[new_min] = e[new_min]
+            shares[k] = dq
+        return shares
+
+    @staticmethod
+    def _shares(elevation):
+        """:return: the shares (see _droplet_shares) of every tile of the map"""
+        height, width = elevation.shape
+        padded = numpy.pad(elevation, 1, mode='constant', constant_values=numpy.inf)
+        around = numpy.array([padded[1 + dy:1 + dy + height, 1 + dx:1 + dx + width]
+                              for dx, dy in _NEIGHBOURS])
+        return WatermapSimulation._droplet_shares(elevation, around)
+
+    @staticmethod
+    def _flow(world, n):
+        """
+        Flow accumulation: every land tile receives the precipitation of n
+        droplets spread over the land, and passes what it holds on to its
+        lower neighbours, in proportion of the shares a droplet would give
+        them (see _shares). Water reaching the ocean is lost, tiles with no
+        lower neighbour keep it. A tile only gives water away once it has
+        received all of it: the tiles are processed level by level, a level
+        being the tiles whose higher neighbours have all been processed.
+        The watermap of a tile is the water it received, plus what it kept.
+        """
+        elevation = world.layers['elevation'].data
+        ocean = world.layers['ocean'].data
+        height, width = elevation.shape
+        land = numpy.logical_not(ocean).ravel()
+        watermap = numpy.zeros(height * width)
+        if not land.any():
+            return watermap.reshape((height, width)), WatermapSimulation._thresholds(
+                world, watermap.reshape((height, width)))
+
+        precipitation = world.layers['precipitation'].data.ravel()
+        held = numpy.where(numpy.logical_and(land, precipitation > 0), precipitation, 0.0)
+        held *= float(n) / numpy.count_nonzero(land)
+
+        shares = WatermapSimulation._shares(elevation)
+        total = shares.sum(axis=0).ravel()
+
+        # the edges of the flow, from land tiles to their lower land neighbours
+        sources, targets, fractions = [], [], []
+        for k, (dx, dy) in enumerate(_NEIGHBOURS):
+            s = numpy.flatnonzero(numpy.logical_and(land, shares[k].ravel() > 0))
+            t = s + dy * width + dx
+            on_land = land[t]
+            s, t = s[on_land], t[on_land]
+            sources.append(s)
+            targets.append(t)
+            fractions.append(shares[k].ravel()[s] / total[s].astype(float))
+        order = numpy.argsort(numpy.concatenate(sources), kind='mergesort')
+        sources = numpy.concatenate(sources)[order]
+        targets = numpy.concatenate(targets)[order]
+        fractions = numpy.concatenate(fractions)[order]
+        first_edge = numpy.searchsorted(sources, numpy.arange(height * width + 1))
+
+        pending = numpy.bincount(targets, minlength=height * width)  # higher neighbours not processed yet
+        level = numpy.flatnonzero(numpy.logical_and(land, pending == 0))
+        while level.size:
+            starts, counts = first_edge[level], first_edge[level + 1] - first_edge[level]
+            level = level[counts > 0]
+            starts, counts = starts[counts > 0], counts[counts > 0]
+            if not level.size:
+                break
+            # the indices of all the edges leaving the level
+            edges = numpy.repeat(starts - numpy.cumsum(counts) + counts, counts) + \
+                numpy.arange(counts.sum())
+            given = numpy.repeat(held[level], counts) * fractions[edges]
+            to = targets[edges]
+            numpy.add.at(held, to, given)
+            numpy.add.at(watermap, to, given)
+            numpy.subtract.at(pending, to, 1)
+            level = numpy.unique(to[pending[to] == 0])
+
+        sinks = numpy.logical_and(land, total == 0)
+        watermap[sinks] += held[sinks]
+        watermap = watermap.reshape((height, width))
+        return watermap, WatermapSimulation._thresholds(world, watermap)
+
+    @staticmethod
+    def _particles(world, seed, density):
+        """
+        Droplets falling on random land tiles (density per land tile, drawn
+        from a generator seeded with seed) flow like in _watermap, but
+        advance together, one tile per round: every round the droplets look
+        at the watermap left by the previous one, split among their lower
+        neighbours and stop once they carry 0.05 or less.
+        :return: the watermap, its thresholds and the amount of work done:
+                 the number of droplets, of rounds and of particle steps
+                 (a droplet, or part of one, leaving a tile)
+        """
+        elevation = world.layers['elevation'].data
+        ocean = world.layers['ocean'].data
+        height, width = elevation.shape
+        # padded: droplets never leave the map, nor flow into the ocean
+        levels = numpy.pad(elevation, 1, mode='constant', constant_values=numpy.inf)
+        sea = numpy.pad(ocean, 1, mode='constant', constant_values=True)
+        water = numpy.zeros(levels.shape)
+
+        land_y, land_x = numpy.nonzero(numpy.logical_not(ocean))
+        n = int(round(density * len(land_y)))
+        rng = numpy.random.RandomState(seed)  # create our own random generator
+        picks = rng.randint(0, len(land_y), size=n) if n else numpy.zeros(0, dtype=int)
+        y, x = land_y[picks] + 1, land_x[picks] + 1
+        q = world.layers['precipitation'].data[y - 1, x - 1]
+        y, x, q = y[q > 0], x[q > 0], q[q > 0]
+
+        offsets = numpy.array(_NEIGHBOURS)
+        stats = {'droplets': n, 'rounds': 0, 'particle_steps': 0}
+        while q.size:
+            stats['rounds'] += 1
+            stats['particle_steps'] += q.size
+            ny = y[numpy.newaxis, :] + offsets[:, 1, numpy.newaxis]
+            nx = x[numpy.newaxis, :] + offsets[:, 0, numpy.newaxis]
+            shares = WatermapSimulation._droplet_shares(levels[y, x] + water[y, x],
+                                                        levels[ny, nx] + water[ny, nx])
+            total = shares.sum(axis=0)
+
+            stuck = total == 0  # no lower neighbour, the water stays
+            numpy.add.at(water, (y[stuck], x[stuck]), q[stuck])
+
+            k, i = numpy.nonzero(numpy.logical_and(shares > 0, numpy.logical_not(sea[ny, nx])))
+            ql = q[i] / total[i] * shares[k, i]
+            y, x = ny[k, i], nx[k, i]
+            numpy.add.at(water, (y, x), ql)
+            going = ql > 0.05
+            y, x, q = y[going], x[going], ql[going]
+
+        watermap = water[1:-1, 1:-1]
+        return watermap, WatermapSimulation._thresholds(world, watermap), stats
 
     @staticmethod
     def _watermap(world, n):
         def droplet(world, pos, q, _watermap):
-            if q < 0:
-                return
-            x, y = pos
-            pos_elev = world.layers['elevation'].data[y, x] + _watermap[y, x]
-            lowers = []
-            min_higher = None
-            min_lower = None
-            # pos_min_higher = None  # TODO: no longer used?
-            tot_lowers = 0
-            for p in world.tiles_around((x, y)):#TODO: switch to numpy
-                px, py = p
-                e = world.layers['elevation'].data[py, px] + _watermap[py, px]
-                if e < pos_elev:
-                    dq = int(pos_elev - e) << 2
-                    if min_lower is None or e < min_lower:
-                        min_lower = e
-                        if dq == 0:
-                            dq = 1
-                    lowers.append((dq, p))
-                    tot_lowers += dq
-
+            # depth first, like the recursive implementation did: the water
+            # of a droplet is added to a tile just before the droplet leaves
+            # it; a stack instead of recursion, not limited in depth
+            stack = [(pos, q, None)]
+            while stack:
+                (x, y), q, arriving = stack.pop()
+                if arriving is not None:
+                    _watermap[y, x] += arriving
+                    if not arriving > 0.05:
+                        continue
+                if q < 0:
+                    continue
+                pos_elev = elevation[y, x] + _watermap[y, x]
+                lowers = []
+                min_lower = None
+                tot_lowers = 0
+                for p in world.tiles_around((x, y)):
+                    px, py = p
+                    e = elevation[py, px] + _watermap[py, px]
+                    if e < pos_elev:
+                        dq = int(pos_elev - e) << 2
+                        if min_lower is None or e < min_lower:
+                            min_lower = e
+                            if dq == 0:
+                                dq = 1
+                        lowers.append((dq, p))
+                        tot_lowers += dq
+                if lowers:
+                    f = q / tot_lowers
+                    for s, p in reversed(lowers):
+                        if not ocean[p[1], p[0]]:
+                            ql = f * s
+                            stack.append((p, ql, ql))
                 else:
-                    if min_higher is None or e > min_higher:
-                        min_higher = e
-                        # pos_min_higher = p
-            if lowers:
-                f = q / tot_lowers
-                for l in lowers:
-                    s, p = l
-                    if not world.is_ocean(p):
-                        px, py = p
-                        ql = f * s
-                        # ql = q
-                        going = ql > 0.05
-                        _watermap[py, px] += ql
-                        if going:
-                            droplet(world, p, ql, _watermap)
-            else:
-                _watermap[y, x] += q
+                    _watermap[y, x] += q
 
+        elevation = world.layers['elevation'].data
+        ocean = world.layers['ocean'].data
         _watermap_data = numpy.zeros((world.size.height, world.size.width), dtype=float)
 
         # This indirectly calls the global rng.
@@ -73,9 +265,4 @@ class WatermapSimulation(object):
                 if world.precipitations_at((x, y)) > 0:
                     droplet(world, (x, y), world.precipitations_at((x, y)), _watermap_data)
 
-        ocean = world.layers['ocean'].data
-        thresholds = dict()
-        thresholds['creek'] = find_threshold_f(_watermap_data, 0.05, ocean=ocean)
-        thresholds['river'] = find_threshold_f(_watermap_data, 0.02, ocean=ocean)
-        thresholds['main river'] = find_threshold_f(_watermap_data, 0.007, ocean=ocean)
-        return _watermap_data, thresholds
+        return _watermap_data, WatermapSimulation._thresholds(world, _watermap_data)
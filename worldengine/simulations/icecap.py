@@ -9,25 +9,41 @@ class IcecapSimulation(object):
     # TODO: Find out if a desert planet could still freeze or if the freeze-threshold is dynamic.
     # TODO: Freeze rivers etc.
 
+    reads = ('ocean', 'temperature')
+    writes = ('icecap',)
+    lazy = True  # only executed if its layer is needed (cf. worldengine.scheduler)
+
+    # 'legacy' draws a random number for every cell which may freeze, in
+    # raster order, like the cell by cell implementation did: a seed always
+    # gives the same ice. 'fast' draws a random field for the whole map.
+    MODES = ('legacy', 'fast')
+
+    def __init__(self, mode='legacy'):
+        if mode not in self.MODES:
+            raise ValueError("Unknown mode '%s', expected one of %s" % (mode, ', '.join(self.MODES)))
+        self.mode = mode
+
     @staticmethod
     def is_applicable(world):
         return {'ocean', 'temperature'} <= set(world.layers.keys())
 
     def execute(self, world, seed):
         assert IcecapSimulation.is_applicable(world)
-        world.icecap = self._calculate(world, seed)
+        world.icecap = self._calculate(world, seed, self.mode)
 
     @staticmethod
-    def _calculate(world, seed):
+    def _calculate(world, seed, mode='legacy'):
         # Notes on performance:
         #  -method is run once per generation
-        #  -iterations        : width * height
+        #  -the neighbours of a tile are only looked up for the tiles whose
+        #   freezing changes the surroundings of others, by wavefronts
         #  -memory consumption: width * height * sizeof(numpy.float) (permanent)
-        #                       width * height * sizeof(numpy.bool) (temporary)
+        #                       a few width * height arrays (temporary)
 
         # constants for convenience (or performance)
         ocean = world.layers['ocean'].data
         temperature = world.layers['temperature'].data
+        height, width = temperature.shape
 
         # primary constants (could be used as global variables at some point); all values should be in [0, 1]
         max_freeze_percentage = 0.60  # only the coldest x% of the cold area will freeze (0 = no ice, 1 = all ice)
@@ -47,34 +63,64 @@ class IcecapSimulation(object):
         freeze_chance_threshold = freeze_threshold * (1.0 - freeze_chance_window)
 
         # local variables
-        icecap = numpy.zeros((world.size.height, world.size.width), dtype=float)
+        icecap = numpy.zeros((height, width), dtype=float)
         rng = numpy.random.RandomState(seed)  # create our own random generator
 
         # map that is True whenever there is land or (certain) ice around
         solid_map = numpy.logical_or(temperature <= freeze_chance_threshold + temp_min, numpy.logical_not(ocean))
 
-        for y in range(world.size.height):
-            for x in range(world.size.width):
-                if world.is_ocean((x, y)):  # or world.river_map[y, x] > 0 or world.lake_map[y, x] > 0 or world.watermap['data'][y, x] > 0:
-                    t = temperature[y, x]
-                    if t - temp_min < freeze_threshold:
-                        # map temperature to freeze-chance (linear interpolation)
-                        chance = numpy.interp(t, [temp_min, freeze_chance_threshold, freeze_threshold], [1.0, 1.0, 0.0])
-                        # *will* freeze for temp_min <= t <= freeze_chance_threshold
-                        # *can* freeze for freeze_chance_threshold < t < freeze_threshold
-
-                        # count number of frozen/solid tiles around this one
-                        if 0 < x < world.size.width - 1 and 0 < y < world.size.height - 1:  # exclude borders
-                            surr_tiles = solid_map[y-1:y+2, x-1:x+2]
-                            chance_mod = numpy.count_nonzero(surr_tiles)
-                            chance_mod -= 1 if solid_map[y, x] else 0  # remove center-tile (i.e. the current tile)
-
-                            # map amount of tiles to chance-modifier, [-1.0, 1.0]
-                            chance_mod = numpy.interp(chance_mod, [0, surr_tiles.size - 1], [-1.0, 1.0])
-                            chance += chance_mod * surrounding_tile_influence
-
-                        if rng.rand() <= chance:  # always freeze for chance >= 1.0, never for <= 0.0
-                            solid_map[y, x] = True  # mark tile as frozen
-                            icecap[y, x] = freeze_threshold - (t - temp_min)  # thickness of the ice (arbitrary scale)
+        # the tiles which may freeze (or river_map > 0, lake_map > 0, watermap > 0...)
+        candidates = numpy.logical_and(ocean, temperature - temp_min < freeze_threshold)
+        if mode == 'legacy':
+            draws = numpy.ones((height, width))
+            draws[candidates] = rng.rand(numpy.count_nonzero(candidates))
+        else:
+            draws = rng.rand(height, width)
+
+        # map temperature to freeze-chance (linear interpolation)
+        chance = numpy.interp(temperature, [temp_min, freeze_chance_threshold, freeze_threshold], [1.0, 1.0, 0.0])
+        # *will* freeze for temp_min <= t <= freeze_chance_threshold
+        # *can* freeze for freeze_chance_threshold < t < freeze_threshold
+
+        # chance-modifier by number of frozen/solid tiles around (0 to 8), [-1.0, 1.0]
+        modifiers = numpy.interp(numpy.arange(9), [0, 8], [-1.0, 1.0]) * surrounding_tile_influence
+
+        # the surroundings of the tiles which are not on the border, as seen
+        # by them: the tiles before them in raster order (W, NW, N, NE) have
+        # been decided, those after them are still as they started
+        inner = numpy.zeros((height, width), dtype=bool)
+        inner[1:-1, 1:-1] = True
+        solid_around = numpy.zeros((height, width), dtype=int)
+        padded = numpy.pad(solid_map, 1, mode='constant').astype(int)
+        for dy in (-1, 0, 1):
+            for dx in (-1, 0, 1):
+                if dy or dx:
+                    solid_around += padded[1 + dy:1 + dy + height, 1 + dx:1 + dx + width]
+
+        # only tiles which are not solid yet change the surroundings of
+        # others when they freeze; border tiles do not depend on theirs
+        changing = numpy.logical_and(candidates, numpy.logical_not(solid_map))
+        frozen = numpy.zeros((height + 2, width + 2), dtype=bool)  # padded
+        border = numpy.logical_and(changing, numpy.logical_not(inner))
+        frozen[1:-1, 1:-1][border] = draws[border] <= chance[border]
+
+        # wavefronts: a tile depends on tiles (y, x - 1), (y - 1, x - 1),
+        # (y - 1, x) and (y - 1, x + 1), all of which have a lower 2 * y + x
+        ys, xs = numpy.nonzero(numpy.logical_and(changing, inner))
+        order = numpy.argsort(2 * ys + xs, kind='mergesort')
+        ys, xs = ys[order], xs[order]
+        fronts = numpy.flatnonzero(numpy.diff(2 * ys + xs)) + 1
+        for front_ys, front_xs in zip(numpy.split(ys, fronts), numpy.split(xs, fronts)):
+            py, px = front_ys + 1, front_xs + 1
+            around = solid_around[front_ys, front_xs] + frozen[py, px - 1] + \
+                frozen[py - 1, px - 1] + frozen[py - 1, px] + frozen[py - 1, px + 1]
+            frozen[py, px] = draws[front_ys, front_xs] <= \
+                chance[front_ys, front_xs] + modifiers[around]
+
+        # all the tiles which may freeze, now that their surroundings are known
+        chance[inner] += modifiers[solid_around + frozen[1:-1, :-2] + frozen[:-2, :-2] +
+                                   frozen[:-2, 1:-1] + frozen[:-2, 2:]][inner]
+        freezing = numpy.logical_and(candidates, draws <= chance)  # always freeze for chance >= 1.0, never for <= 0.0
+        icecap[freezing] = freeze_threshold - (temperature[freezing] - temp_min)  # thickness of the ice (arbitrary scale)
 
         return icecap
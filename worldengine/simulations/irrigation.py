@@ -1,52 +1,56 @@
 import numpy
 
+# the kernel of every radius used so far, see _kernel
+_kernels = {}
+
+
+def _kernel(radius):
+    """
+    :return: the share of the water of a tile which reaches the tiles up to
+             radius away (horizontally and vertically) from it:
+             1 / (ln(sqrt(dx^2 + dy^2) + 1) + 1)
+    """
+    if radius not in _kernels:
+        d = numpy.arange(-radius, radius + 1, 1, dtype=float)
+        x, y = numpy.meshgrid(d, d)#x/y distances to array center
+        _kernels[radius] = 1.0 / (numpy.log1p(numpy.sqrt(numpy.square(x) + numpy.square(y))) + 1)
+    return _kernels[radius]
+
+
 class IrrigationSimulation(object):
+    reads = ('watermap', 'ocean')
+    writes = ('irrigation',)
+
+    def __init__(self, radius=10):
+        """:param radius: how far (in tiles) the water of an ocean tile irrigates"""
+        self.radius = radius
+
     @staticmethod
     def is_applicable(world):
         return 'watermap' in world.layers and ('irrigation' not in world.layers)
 
     def execute(self, world, seed):
         assert IrrigationSimulation.is_applicable(world)
-        world.irrigation = self._calculate(world)
+        world.irrigation = self._calculate(world, self.radius)
 
     @staticmethod
-    def _calculate(world):
+    def _calculate(world, radius=10):
         # Notes on performance:
         #  -method is run once per generation
-        #  -iterations        : width * height
+        #  -every ocean tile spreads its water over the tiles around it: a
+        #   convolution, computed with FFTs (O(width * height * log(width * height)))
         #  -memory consumption: width * height * sizeof(numpy.float) (permanent)
+        #                       a few (width + 2 * radius) * (height + 2 * radius) arrays (temporary)
 
-        width = world.size.width
-        height = world.size.height
-        radius = 10
-
-        #create array of pre-calculated values -> less calculations
-        d = numpy.arange(-radius, radius + 1, 1, dtype=float)
-        x, y = numpy.meshgrid(d, d)#x/y distances to array center
-        #calculate final matrix: ln(sqrt(x^2+y^2) + 1) + 1
-        logs = numpy.log1p(numpy.sqrt(numpy.square(x) + numpy.square(y))) + 1
-
-        #create output array
-        values = numpy.zeros((height, width), dtype=float)
-
-        it_all = numpy.nditer(values, flags=['multi_index'], op_flags=['readonly'])
-        while not it_all.finished:
-            x = it_all.multi_index[1]
-            y = it_all.multi_index[0]
-            if world.is_ocean((x, y)):
-                #coordinates used for the values-slice (tl = top-left etc.)
-                tl_v = (max(x - radius, 0)        , max(y - radius, 0))
-                br_v = (min(x + radius, width - 1), min(y + radius, height - 1))
-                #coordinates used for the logs-slice
-                tl_l = (max(radius - x, 0)        , max(radius - y, 0))
-                br_l = (min(radius - x + width - 1, 2 * radius), min(radius - y + height - 1, 2 * radius))
-
-                #extract the necessary parts of the arrays
-                logs_relevant = logs[tl_l[1]:br_l[1]+1, tl_l[0]:br_l[0]+1]
-
-                #finish calculation
-                values[tl_v[1]:br_v[1]+1, tl_v[0]:br_v[0]+1] += world.layers['watermap'].data[y, x] / logs_relevant
+        height, width = world.layers['ocean'].data.shape
+        sources = numpy.where(world.layers['ocean'].data, world.layers['watermap'].data, 0.0)
+        if not sources.any():
+            return numpy.zeros((height, width))
 
-            it_all.iternext()
+        # padded so that the water spreading beyond a border is lost instead
+        # of wrapping around to the opposite border
+        shape = (height + 2 * radius, width + 2 * radius)
+        spread = numpy.fft.irfft2(numpy.fft.rfft2(sources, shape) *
+                                  numpy.fft.rfft2(_kernel(radius), shape), shape)
 
-        return values
+        return spread[radius:radius + height, radius:radius + width]
@@ -1,8 +1,21 @@
-from worldengine.simulations.basic import find_threshold_f
+from worldengine.simulations.basic import find_thresholds
 import numpy
 
 
 class MoistureSimulation(object):
+    reads = ('precipitation', 'irrigation', 'ocean')
+    writes = ('moisture',)
+
+    # float32 halves the memory of the layer, its quantiles being exact for
+    # the values as they are stored
+    DTYPES = ('float64', 'float32')
+
+    def __init__(self, dtype='float64'):
+        """:param dtype: the type of the values of the moisture layer"""
+        if numpy.dtype(dtype).name not in self.DTYPES:
+            raise ValueError("Unknown dtype '%s', expected one of %s" % (dtype, ', '.join(self.DTYPES)))
+        self.dtype = numpy.dtype(dtype)
+
     @staticmethod
     def is_applicable(world):
         return {'precipitation', 'irrigation'} <= set(world.layers.keys()) and (
@@ -11,27 +24,27 @@ class MoistureSimulation(object):
     def execute(self, world, seed):
         assert MoistureSimulation.is_applicable(world)
         assert seed is not None
-        data, quantiles = self._calculate(world)
+        data, quantiles = self._calculate(world, self.dtype)
         world.moisture = (data, quantiles)
 
     @staticmethod
-    def _calculate(world):
+    def _calculate(world, dtype=numpy.float64):
         moisture_ranges = world.moisture_ranges
         precipitationWeight = 1.0
         irrigationWeight = 3
-        data = numpy.zeros((world.size.height, world.size.width), dtype=float)
 
-        data = (world.layers['precipitation'].data * precipitationWeight - world.layers['irrigation'].data * irrigationWeight)/(precipitationWeight + irrigationWeight)
+        # (precipitation * precipitationWeight - irrigation * irrigationWeight) /
+        # (precipitationWeight + irrigationWeight), computed in a single buffer;
+        # the weight of the precipitation being 1, it is added as it is
+        data = numpy.empty((world.size.height, world.size.width), dtype=dtype)
+        numpy.multiply(world.layers['irrigation'].data, -irrigationWeight, out=data)
+        numpy.add(data, world.layers['precipitation'].data, out=data)
+        data /= precipitationWeight + irrigationWeight
 
         # These were originally evenly spaced at 12.5% each but changing them
         # to a bell curve produced better results
         ocean = world.layers['ocean'].data
-        quantiles = {}
-        quantiles['12'] = find_threshold_f(data, moisture_ranges[6], ocean)
-        quantiles['25'] = find_threshold_f(data, moisture_ranges[5], ocean)
-        quantiles['37'] = find_threshold_f(data, moisture_ranges[4], ocean)
-        quantiles['50'] = find_threshold_f(data, moisture_ranges[3], ocean)
-        quantiles['62'] = find_threshold_f(data, moisture_ranges[2], ocean)
-        quantiles['75'] = find_threshold_f(data, moisture_ranges[1], ocean)
-        quantiles['87'] = find_threshold_f(data, moisture_ranges[0], ocean)
+        names = ['12', '25', '37', '50', '62', '75', '87']
+        fractions = [moisture_ranges[6 - i] for i in range(len(names))]
+        quantiles = dict(zip(names, find_thresholds(data, fractions, ocean)))
         return data, quantiles
@@ -1,10 +1,14 @@
-from worldengine.simulations.basic import find_threshold_f
-from noise import snoise2
+from worldengine.simulations.basic import find_thresholds
+from worldengine.noise_fields import noise_field
 import numpy
 
 
 class PermeabilitySimulation(object):
 
+    reads = ('ocean',)
+    writes = ('permeability',)
+    lazy = True  # only executed if its layer is needed (cf. worldengine.scheduler)
+
     @staticmethod
     def is_applicable(world):
         return not 'permeability' in world.layers
@@ -13,9 +17,10 @@ class PermeabilitySimulation(object):
         assert PermeabilitySimulation.is_applicable(world)
         perm = self._calculate(seed, world.size.width, world.size.height)
         ocean = world.layers['ocean'].data
+        low, med = find_thresholds(perm, [0.75, 0.25], ocean)
         perm_th = [
-            ('low', find_threshold_f(perm, 0.75, ocean)),
-            ('med', find_threshold_f(perm, 0.25, ocean)),
+            ('low', low),
+            ('med', med),
             ('hig', None)
         ]
         world.permeability = (perm, perm_th)
@@ -25,15 +30,7 @@ class PermeabilitySimulation(object):
         rng = numpy.random.RandomState(seed)  # create our own random generator
         base = rng.randint(0, 4096)
 
-        perm = numpy.zeros((height, width), dtype=float)
-
         octaves = 6
         freq = 64.0 * octaves
 
-        for y in range(0, height):#TODO: numpy optimization?
-            # yscaled = float(y) / height  # TODO: what is this?
-            for x in range(0, width):
-                n = snoise2(x / freq, y / freq, octaves, base=base)
-                perm[y, x] = n
-
-        return perm
+        return noise_field((height, width), freq, octaves, base)
@@ -2,12 +2,12 @@
 # extension which is not available when using this project from jython
 
 import platec
-import time
 import numpy
 
-from worldengine.generation import add_noise_to_elevation, center_land, \
+from worldengine.generation import add_lazy_sea_depth, add_noise_to_elevation, center_land, \
     generate_world, initialize_ocean_and_thresholds, place_oceans_at_map_borders
 from worldengine.model.world import World
+from worldengine.profiling import Measurement, measure
 
 # import global logger
 import worldengine.logger as logger
@@ -17,20 +17,19 @@ def generate_plates_simulation(seed, width, height, axial_tilt, sea_level=0.65,
                                aggr_overlap_abs=1000000, aggr_overlap_rel=0.33,
                                cycle_count=2, n_plates=10):
 
-    start_time = time.time()
-    p = platec.create(seed, width, height, sea_level, erosion_period,
-                      folding_ratio, aggr_overlap_abs, aggr_overlap_rel,
-                      cycle_count, n_plates)
-    # Note: To rescale the worlds heightmap to roughly Earths scale, multiply by 2000.
-
-    while platec.is_finished(p) == 0:
-        # TODO: add a if verbose: message here?
-        platec.step(p)
-    hm = platec.get_heightmap(p)
-    pm = platec.get_platesmap(p)
-    elapsed_time = time.time() - start_time
+    with Measurement('generate_plates_simulation') as measurement:
+        p = platec.create(seed, width, height, sea_level, erosion_period,
+                          folding_ratio, aggr_overlap_abs, aggr_overlap_rel,
+                          cycle_count, n_plates)
+        # Note: To rescale the worlds heightmap to roughly Earths scale, multiply by 2000.
+
+        while platec.is_finished(p) == 0:
+            # TODO: add a if verbose: message here?
+            platec.step(p)
+        hm = platec.get_heightmap(p)
+        pm = platec.get_platesmap(p)
     logger.logger.debug('...plates.generate_plates_simulation() complete. \
-Elapsed time {} seconds.'.format(elapsed_time))
+Elapsed time {} seconds.'.format(measurement.wall_time))
     return hm, pm
 
 
@@ -49,31 +48,72 @@ def _plates_simulation(name, width, height, axial_tilt, seed, temperature_ranges
     return world
 
 
-def world_gen(name, width, height, axial_tilt, seed, temperature_ranges=[.874, .765, .594, .439, .366, .124],
-              moisture_ranges=[.941, .778, .507, .236, 0.073, .014, .002], n_plates=10,
-              ocean_level=1.0, gamma_value=1.25, gamma_offset=.2,
-              fade_borders=True):
-    start_time = time.time()
-    world = _plates_simulation(name, width, height, axial_tilt, seed, temperature_ranges, moisture_ranges, gamma_value,
-                               gamma_offset, n_plates, ocean_level)
+def _initial_world(name, width, height, axial_tilt, seed, temperature_ranges, moisture_ranges, n_plates,
+                   ocean_level, gamma_value, gamma_offset, fade_borders, report=None):
+    with measure(report, 'plates simulation') as measurement:
+        world = _plates_simulation(name, width, height, axial_tilt, seed, temperature_ranges, moisture_ranges,
+                                   gamma_value, gamma_offset, n_plates, ocean_level)
 
-    center_land(world)
-    elapsed_time = time.time() - start_time
+        center_land(world)
+    measurement.add_layers(world.layers)
     logger.logger.debug('...plates.world_gen: set_elevation, set_plates, \
-center_land complete. Elapsed time {} seconds.'.format(elapsed_time))
+center_land complete. Elapsed time {} seconds.'.format(measurement.wall_time))
 
-    start_time = time.time()
-    add_noise_to_elevation(world, numpy.random.randint(0, 4096))  # uses the global RNG; this is the very first call to said RNG - should that change, this needs to be taken care of
-    elapsed_time = time.time() - start_time
+    with measure(report, 'elevation noise') as measurement:
+        add_noise_to_elevation(world, numpy.random.randint(0, 4096))  # uses the global RNG; this is the very first call to said RNG - should that change, this needs to be taken care of
     logger.logger.debug('...plates.world_gen: elevation noise added. Elapsed \
-time {} seconds.'.format(elapsed_time))
+time {} seconds.'.format(measurement.wall_time))
 
-    start_time = time.time()
-    if fade_borders:
-        place_oceans_at_map_borders(world)
-    initialize_ocean_and_thresholds(world)
-    elapsed_time = time.time() - start_time
+    with measure(report, 'oceans') as measurement:
+        if fade_borders:
+            place_oceans_at_map_borders(world)
+        initialize_ocean_and_thresholds(world)
+    measurement.add_layers(dict((name, world.layers[name]) for name in ('elevation', 'ocean')))
     logger.logger.debug('...plates.world_gen: oceans initialized. Elapsed \
-time {} seconds.'.format(elapsed_time))
+time {} seconds.'.format(measurement.wall_time))
+
+    return world
+
+
+def world_gen(name, width, height, axial_tilt, seed, temperature_ranges=[.874, .765, .594, .439, .366, .124],
+              moisture_ranges=[.941, .778, .507, .236, 0.073, .014, .002], n_plates=10,
+              ocean_level=1.0, gamma_value=1.25, gamma_offset=.2,
+              fade_borders=True, jobs=1, cache=None, report=None, stage_options=None):
+    """
+    :param jobs: the number of simulations that may run at the same time
+    :param cache: an optional worldengine.cache.StageCache used to store, and
+                  reuse, the output of the plates simulation and of every
+                  simulation run by generate_world
+    :param report: an optional worldengine.profiling.GenerationReport
+                   receiving the measurement of every step
+    :param stage_options: the keyword arguments of the constructor of the
+                          simulations run by generate_world, by class name
+    """
+    params = (width, height, axial_tilt, seed, temperature_ranges, moisture_ranges, n_plates,
+              ocean_level, gamma_value, gamma_offset, fade_borders)
+
+    entry = None
+    if cache is not None:
+        # the state of the global RNG decides the elevation noise
+        key = cache.key('world_gen', params, numpy.random.get_state())
+        entry = cache.load(key)
+
+    if entry is not None:
+        measurement = measure(report, 'initial world')
+        measurement.cached = True
+        _, layers, rng_state = entry
+        measurement.add_layers(layers)
+        world = World(name, width, height, seed, axial_tilt, n_plates, ocean_level,
+                      temperature_ranges, moisture_ranges, gamma_value, gamma_offset)
+        world.layers.update(layers)
+        if 'sea_depth' not in world.layers:
+            add_lazy_sea_depth(world, 1.0)  # the ocean level of initialize_ocean_and_thresholds
+        numpy.random.set_state(rng_state)
+        logger.logger.debug('...plates.world_gen: initial world loaded from cache')
+    else:
+        world = _initial_world(name, *params, report=report)
+        if cache is not None:
+            cache.store(key, (None, world.layers.materialized(), numpy.random.get_state()))
 
-    return generate_world(world)
+    return generate_world(world, jobs=jobs, cache=cache, report=report,
+                          stage_options=stage_options)
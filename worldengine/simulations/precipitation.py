@@ -1,32 +1,32 @@
-import time
 import numpy
-from noise import snoise2
 
-from worldengine.simulations.basic import find_threshold_f
+from worldengine.noise_fields import wrapped_noise_field
+
+from worldengine.simulations.basic import find_thresholds
 
 # import global logger
 import worldengine.logger as logger
 
 class PrecipitationSimulation(object):
 
+    reads = ('temperature', 'ocean')
+    writes = ('precipitation',)
+
     @staticmethod
     def is_applicable(world):
         return not 'precipitation' in world.layers
 
     def execute(self, world, seed):
         assert PrecipitationSimulation.is_applicable(world)
-        start_time = time.time()
         pre_calculated = self._calculate(seed, world)
         ocean = world.layers['ocean'].data
+        low, med = find_thresholds(pre_calculated, [0.75, 0.3], ocean)
         ths = [
-            ('low', find_threshold_f(pre_calculated, 0.75, ocean)),
-            ('med', find_threshold_f(pre_calculated, 0.3, ocean)),
+            ('low', low),
+            ('med', med),
             ('hig', None)
         ]
         world.precipitation = (pre_calculated, ths)
-        elapsed_time = time.time() - start_time
-        logger.logger.debug('...precipitations calculated. Elapsed time {} \
-seconds.'.format(elapsed_time))
 
     @staticmethod
     def _calculate(seed, world):
@@ -39,7 +39,6 @@ seconds.'.format(elapsed_time))
         height = world.size.height
         width = world.size.width
         border = width / 4
-        precipitations = numpy.zeros((height, width), dtype=float)
 
         octaves = 6
         freq = 64.0 * octaves
@@ -48,18 +47,9 @@ seconds.'.format(elapsed_time))
                                        #so that worlds sharing a common seed but
                                        #different sizes will have similar patterns
 
-        for y in range(height):#TODO: numpy
-            for x in range(width):
-                n = snoise2((x * n_scale) / freq, (y * n_scale) / freq, octaves, base=base)
-
-                # Added to allow noise pattern to wrap around right and left.
-                if x < border:
-                    n = (snoise2( (x * n_scale) / freq, (y * n_scale) / freq, octaves,
-                                 base=base) * x / border) + (
-                        snoise2(( (x * n_scale) + width) / freq, (y * n_scale) / freq, octaves,
-                                base=base) * (border - x) / border)
-
-                precipitations[y, x] = n
+        # wraps around right and left over the columns with x < border
+        precipitations = wrapped_noise_field((height, width), freq, octaves, base,
+                                             border, scale=n_scale)
 
         #find ranges
         min_precip = precipitations.min()